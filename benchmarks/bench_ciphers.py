@@ -0,0 +1,57 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Compare the CBC decryption speed of every available cipher backend.
+
+Usage: python benchmarks/bench_ciphers.py [megabytes]
+"""
+
+import os
+import sys
+import time
+
+from pypwsafe import ciphers, twofish
+
+
+DEFAULT_SIZE_MB = 4
+
+
+def bench(backend, key, iv, data):
+    start = time.perf_counter()
+    backend.cbc_decrypt(key, iv, data)
+    return time.perf_counter() - start
+
+
+def main(argv):
+    size_mb = float(argv[1]) if len(argv) > 1 else DEFAULT_SIZE_MB
+    size = int(size_mb * 2**20) // 16 * 16
+    key, iv, data = os.urandom(32), os.urandom(16), os.urandom(size)
+    runs = [(name, ciphers.get_backend(name)) for name in ciphers.available_backends()]
+    if twofish.numpy is not None:
+        numpy, twofish.numpy = twofish.numpy, None
+        try:
+            elapsed = bench(ciphers.get_backend("python"), key, iv, data)
+        finally:
+            twofish.numpy = numpy
+        print("%-16s %10.2f MB/s" % ("python-nonumpy", size / elapsed / 2**20))
+    for name, backend in runs:
+        elapsed = bench(backend, key, iv, data)
+        print("%-16s %10.2f MB/s" % (name, size / elapsed / 2**20))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
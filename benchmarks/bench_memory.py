@@ -0,0 +1,90 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Measure the memory held per record by a loaded safe.
+
+A safe with the given number of entries is generated in a temporary
+directory, then loaded under tracemalloc.
+
+Usage: python benchmarks/bench_memory.py [entries]
+"""
+
+import datetime
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from pypwsafe import PWSafe3, consts
+from pypwsafe.records import Record
+
+
+DEFAULT_ENTRIES = 100000
+
+PASSWORD = "bogus12345"
+
+
+def generate(filename, entries):
+    safe = PWSafe3(filename, PASSWORD)
+    now = datetime.datetime(2023, 1, 1)
+    for i in range(entries):
+        record = Record()
+        record.setGroup("group%d" % (i % 50), updateEntryModified=False)
+        record.setTitle("entry %d" % i, updateEntryModified=False)
+        record.setUsername("user%d" % i, updateEntryModified=False)
+        record.setPassword("password %d" % i, updateEntryModified=False)
+        record.setNote("note for entry %d" % i, updateEntryModified=False)
+        record.setURL("https://example.com/%d" % i, updateEntryModified=False)
+        record.setCreated(now, updateEntryModified=False)
+        record.setEntryModified(now)
+        safe.records.append(record)
+    safe.serialiaze()
+    with open(filename, "wb") as fl:
+        fl.write(safe.flfull)
+
+
+def measure(filename, entries):
+    gc.collect()
+    tracemalloc.start()
+    safe = PWSafe3(filename, PASSWORD, mode="RO")
+    # Only the parsed objects are kept once a safe is open
+    safe.flfull = safe.cryptdata = safe.fulldata = None
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(safe) == entries
+    return current, peak
+
+
+def main(argv):
+    entries = int(argv[1]) if len(argv) > 1 else DEFAULT_ENTRIES
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.psafe3")
+        generate(filename, entries)
+        print("%d entries, %d bytes on disk" % (entries, os.path.getsize(filename)))
+        for keep_raw in (False, True):
+            consts.KEEP_RAW_DATA = keep_raw
+            current, peak = measure(filename, entries)
+            print(
+                "KEEP_RAW_DATA=%-5s %8.0f bytes/record held, %8.0f bytes/record peak"
+                % (keep_raw, current / entries, peak / entries)
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
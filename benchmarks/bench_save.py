@@ -0,0 +1,94 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Time serializing a safe with the given number of entries.
+
+The encryption is timed separately, so the rest is the cost of turning
+the headers and records into blocks. The first run serializes every
+field; after that only the record changed between runs is serialized again.
+
+Usage: python benchmarks/bench_save.py [entries]
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from pypwsafe import PWSafe3
+from pypwsafe.records import Record
+
+
+DEFAULT_ENTRIES = 20000
+
+RUNS = 3
+
+PASSWORD = "bogus12345"
+
+
+def make_safe(filename, entries):
+    safe = PWSafe3(filename, PASSWORD)
+    now = datetime.datetime(2023, 1, 1)
+    for i in range(entries):
+        record = Record()
+        record.setGroup("group%d" % (i % 50), updateEntryModified=False)
+        record.setTitle("entry %d" % i, updateEntryModified=False)
+        record.setUsername("user%d" % i, updateEntryModified=False)
+        record.setPassword("password %d" % i, updateEntryModified=False)
+        record.setNote("note for entry %d" % i, updateEntryModified=False)
+        record.setURL("https://example.com/%d" % i, updateEntryModified=False)
+        record.setCreated(now, updateEntryModified=False)
+        record.setEntryModified(now)
+        safe.records.append(record)
+    return safe
+
+
+def timed(func, before=None):
+    best = None
+    for i in range(RUNS):
+        if before is not None:
+            before(i)
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    entries = int(argv[1]) if len(argv) > 1 else DEFAULT_ENTRIES
+    with tempfile.TemporaryDirectory() as tmp:
+        safe = make_safe(os.path.join(tmp, "bench.psafe3"), entries)
+        start = time.perf_counter()
+        safe.serialiaze()
+        total = time.perf_counter() - start
+        encrypt = timed(safe.encrypt_data)
+
+        def edit(i):
+            safe.records[i].setTitle("edited %d" % i)
+
+        edited = timed(safe.serialiaze, edit)
+    print("%d entries, %d bytes" % (entries, len(safe.flfull)))
+    print("serialiaze  %8.3f s" % total)
+    print("  encrypt   %8.3f s" % encrypt)
+    print("  packing   %8.3f s, %6.1f us/entry" % (total - encrypt, (total - encrypt) / entries * 1e6))
+    print("one edit    %8.3f s, packing %8.3f s" % (edited, edited - encrypt))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,54 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Time the key stretch of every available engine.
+
+Usage: python benchmarks/bench_stretch.py [exponent ...]
+"""
+
+import os
+import sys
+import time
+
+from pypwsafe import stretch
+
+
+DEFAULT_EXPONENTS = [11, 18, 22]
+
+
+def bench(engine, count, passwd=b"bogus12345", salt=None):
+    salt = salt if salt is not None else os.urandom(32)
+    start = time.perf_counter()
+    engine.stretch(passwd, salt, count)
+    return time.perf_counter() - start
+
+
+def main(argv):
+    exponents = [int(x) for x in argv[1:]] or DEFAULT_EXPONENTS
+    names = stretch.available_engines()
+    print("%-10s %s" % ("iter", "  ".join("%12s" % name for name in names)))
+    for exponent in exponents:
+        count = 2**exponent
+        timings = [bench(stretch.get_engine(name), count) for name in names]
+        print(
+            "%-10s %s"
+            % ("2^%d" % exponent, "  ".join("%10.4f s" % t for t in timings))
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
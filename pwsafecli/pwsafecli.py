@@ -91,69 +91,69 @@ def new_safe(
 ):  # pragma: no cover
     safe = PWSafe3(filename=filename, password=password, mode="RW")
 
-    # Set details
-    safe.setVersion()
-    safe.setTimeStampOfLastSave(datetime.datetime.now())
-    safe.setUUID()
-    safe.setLastSaveApp("psafecli")
+    # Set details and save once; a new safe has nothing to roll back
+    with safe.batch(rollback=False):
+        safe.setVersion()
+        safe.setTimeStampOfLastSave(datetime.datetime.now())
+        safe.setUUID()
+        safe.setLastSaveApp("psafecli")
 
-    if username:
-        safe.setLastSaveUser(username)
+        if username:
+            safe.setLastSaveUser(username)
 
-    try:
-        safe.setLastSaveHost(getfqdn())
-    except:
-        pass
-
-    if dbname:
-        safe.setDbName(dbname)
-    if dbdesc:
-        safe.setDbDesc(dbdesc)
+        try:
+            safe.setLastSaveHost(getfqdn())
+        except:
+            pass
 
-    safe.save()
+        if dbname:
+            safe.setDbName(dbname)
+        if dbdesc:
+            safe.setDbDesc(dbdesc)
 
     return safe
 
 
 def add_or_update_record(psafe, record, options):  # pragma: no cover
-    """Adds an entry to the given psafe. Update if it already exists. Reloads the psafe data once complete."""
-    now = datetime.datetime.now()
+    """Adds an entry to the given psafe. Update if it already exists. Saves the psafe once complete, or with the batch this is called in."""
+    # The CLI exits on errors, so there is nothing to keep for a rollback
+    with psafe.batch(rollback=False):
+        now = datetime.datetime.now()
 
-    if record is None:
-        record = Record()
-        record.setCreated(now)
-    else:
-        record.setEntryModified(now)
+        if record is None:
+            record = Record()
+            record.setCreated(now)
+        else:
+            record.setEntryModified(now)
 
-    if options.username:
-        record.setUsername(options.username)
+        if options.username:
+            record.setUsername(options.username)
 
-    if options.password:
-        record.setPassword(options.password)
+        if options.password:
+            record.setPassword(options.password)
 
-    record.setLastAccess(now)
-    record.setPasswordModified(now)
+        record.setLastAccess(now)
+        record.setPasswordModified(now)
 
-    if options.group:
-        record.setGroup(options.group)
+        if options.group:
+            record.setGroup(options.group)
 
-    if options.title:
-        record.setTitle(options.title)
+        if options.title:
+            record.setTitle(options.title)
 
-    if options.UUID:
-        record.setUUID(options.UUID)
+        if options.UUID:
+            record.setUUID(options.UUID)
 
-    if options.expires:
-        record.setExpires(options.expires)
+        if options.expires:
+            record.setExpires(options.expires)
 
-    if options.url:
-        record.setURL(options.url)
+        if options.url:
+            record.setURL(options.url)
 
-    if options.email:
-        record.setEmail(options.email)
+        if options.email:
+            record.setEmail(options.email)
 
-    psafe.records.append(record)
-    psafe.save()
+        psafe.records.append(record)
     return record.getUUID()
 
 
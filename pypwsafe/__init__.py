@@ -25,26 +25,34 @@ import datetime
 import getpass
 import logging
 import logging.config
+import mmap as _mmap
 import os
 import os.path
 import re
 import socket
+import stat
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from hashlib import sha256
+from hmac import compare_digest
 from hmac import new as HMAC
 from struct import pack, unpack
 from uuid import uuid4
 
-from pygcrypt.ciphers import Cipher
-
-from . import errors, headers
-from .records import Record
+from . import blocks, ciphers, consts, errors, headers, stretch
+from .cache import PPrimeCache  # noqa: F401
+from .probe import SafeInfo, probe, scan_dir  # noqa: F401
+from .records import LazyRecord, Record
+from .stretch import calibrate_iterations
 
 
 log = logging.getLogger("psafe.lib.init")
 log.debug("initing")
 
 
-def stretchkey(passwd, salt, count):
+def stretchkey(passwd, salt, count, engine=None):
     """
     Stretch a key. H(pass+salt)
     @param passwd: The password being stretched
@@ -53,20 +61,75 @@ def stretchkey(passwd, salt, count):
     @type salt: string
     @param count: The number of times to repeat the stretch function
     @type count: int
+    @param engine: Name of the key stretching engine. Auto-selected if not given.
+    @type engine: string
     """
     assert count > 0
-    # Hash once with both
-    inithsh = sha256()
-    inithsh.update(passwd)
-    inithsh.update(salt)
-    # Expecting it in binary form; NOT HEX FORM
-    hsh = inithsh.digest()
-    # Rehash
-    for i in range(count):
-        t = sha256()
-        t.update(hsh)
-        hsh = t.digest()
-    return hsh
+    return stretch.get_engine(engine).stretch(passwd, salt, count)
+
+
+def _check_iterations(iterations):
+    """Raise ValueError unless iterations meets the format minimum and fits ITER."""
+    if not consts.MIN_HASH_ITERATIONS <= iterations <= stretch.MAX_HASH_ITERATIONS:
+        raise ValueError(
+            "Iterations must be between %d and %d"
+            % (consts.MIN_HASH_ITERATIONS, stretch.MAX_HASH_ITERATIONS)
+        )
+
+
+def _hmac_bytes(data):
+    """Header hmac data may be str for ascii-only headers."""
+    if isinstance(data, str):
+        return data.encode("us-ascii")
+    return data
+
+
+def _write_atomic(filename, data, durability):
+    """Replace filename with data through a temp file in the same directory.
+
+    Returns the seconds spent in each step.
+    @param durability: One of consts.DURABILITY_LEVELS
+    @type durability: string
+    """
+    if durability not in consts.DURABILITY_LEVELS:
+        raise ValueError("Unknown durability level %r" % durability)
+    timings = {}
+    start = time.perf_counter()
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(
+        prefix="." + os.path.basename(filename) + ".", suffix=".tmp", dir=dirname
+    )
+    try:
+        with os.fdopen(fd, "wb") as fil:
+            fil.write(data)
+            fil.flush()
+            mark = time.perf_counter()
+            timings["write"] = mark - start
+            if durability != consts.DURABILITY_NONE:
+                os.fsync(fil.fileno())
+            timings["fsync"] = time.perf_counter() - mark
+        try:
+            os.chmod(tmpname, stat.S_IMODE(os.stat(filename).st_mode))
+        except FileNotFoundError:
+            pass
+        mark = time.perf_counter()
+        os.replace(tmpname, filename)
+        timings["replace"] = time.perf_counter() - mark
+    except BaseException:
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        raise
+    mark = time.perf_counter()
+    if durability == consts.DURABILITY_DIR:
+        dirfd = os.open(dirname, os.O_RDONLY)
+        try:
+            os.fsync(dirfd)
+        finally:
+            os.close(dirfd)
+    timings["fsync_dir"] = time.perf_counter() - mark
+    return timings
 
 
 def _findHeader(headers, htype):
@@ -162,12 +225,84 @@ class PWSafe3:
     @type mode: string
     """
 
+    _credentials = None
+    """@ivar: Password, salt, iterations, K and L that P', B1-B4 and H(P') were derived from.
+    @type _credentials: tuple
+    """
+
     iv = None
     """@ivar: Initialization vector used for CBC mode when encrypting / decrypting the header and records.
     @type iv: string[16]
     """
 
-    def __init__(self, filename, password, mode="RW"):
+    pprime_cache = None
+    """@ivar: Opt-in cache of stretched keys shared between opens. None to always stretch.
+    @type pprime_cache: PPrimeCache
+    """
+
+    stream = False
+    """@ivar: Decrypt and parse the file chunk by chunk instead of reading it whole.
+    @type stream: bool
+    """
+
+    headers_only = False
+    """@ivar: Only the headers were loaded. Records are missing and the safe is read-only.
+    @type headers_only: bool
+    """
+
+    hmac_verified = None
+    """@ivar: Whether the HMAC of the file was checked on load. None for new safes.
+    @type hmac_verified: bool
+    """
+
+    lazy = False
+    """@ivar: Parse record properties on first access instead of on load.
+    @type lazy: bool
+    """
+
+    mmap = False
+    """@ivar: Read the file through a read-only memory map instead of into flfull.
+    @type mmap: bool
+    """
+
+    stream_chunk_size = blocks.DEFAULT_CHUNK_SIZE
+    """@ivar: Bytes of ciphertext decrypted at a time when streaming.
+    @type stream_chunk_size: int
+    """
+
+    durability = consts.DURABILITY_FILE
+    """@ivar: Default durability level of save(). One of consts.DURABILITY_LEVELS.
+    @type durability: string
+    """
+
+    save_timings = None
+    """@ivar: Seconds spent in each step of the last save(): serialize, write, fsync, replace, fsync_dir and total.
+    @type save_timings: dict
+    """
+
+    write_behind = None
+    """@ivar: Write-behind saver of the safe. While set, save() only tells it that the safe changed.
+    @type write_behind: pypwsafe.writebehind.WriteBehind
+    """
+
+    _batch = None
+    """@ivar: State of the open batch(): whether the auto-set headers were updated, whether to save and with which durability. None outside a batch.
+    @type _batch: dict
+    """
+
+    def __init__(
+        self,
+        filename,
+        password,
+        mode="RW",
+        pprime_cache=None,
+        iterations=None,
+        target_unlock_ms=None,
+        stream=False,
+        mmap=False,
+        lazy=False,
+        headers_only=False,
+    ):
         """
         @param filename: The path to the Password Safe file. Will be created if it doesn't already exist.
         @type filename: string
@@ -175,9 +310,38 @@ class PWSafe3:
         @type password: string
         @param mode: Read only or read/write mode. "RO" for read-only or "RW" or read/write.
         @type mode: string
+        @param pprime_cache: Cache to look up P' in before stretching. Defaults to the class-wide cache.
+        @type pprime_cache: PPrimeCache
+        @param iterations: Number of key stretch iterations for a new safe. Ignored, with a warning, for an existing safe.
+        @type iterations: int
+        @param target_unlock_ms: Calibrate the iterations of a new safe to take this long to unlock on this machine. Ignored, with a warning, for an existing safe.
+        @type target_unlock_ms: float
+        @param stream: Decrypt and parse an existing safe chunk by chunk to keep a single copy of its data in memory.
+        @type stream: bool
+        @param mmap: Map an existing safe into memory and decrypt straight from the mapping instead of reading it.
+        @type mmap: bool
+        @param lazy: Only index the fields of each record on load, and parse them when first looked up.
+        @type lazy: bool
+        @param headers_only: Only decrypt and parse the headers of an existing safe. Skips the records and the HMAC check, and opens read-only.
+        @type headers_only: bool
         """
-        log.debug("Creating psafe %s" % repr(filename))
+        log.debug("Creating psafe %r", filename)
+        if iterations is not None and target_unlock_ms is not None:
+            raise ValueError("Give either iterations or target_unlock_ms, not both")
+        if iterations is not None:
+            _check_iterations(iterations)
+        if target_unlock_ms is not None and target_unlock_ms <= 0:
+            raise ValueError("target_unlock_ms must be positive")
         self.locked = False
+        self.stream = stream
+        self.mmap = mmap
+        self.lazy = lazy
+        self.headers_only = headers_only
+        if headers_only:
+            # Saving would drop the records
+            mode = "RO"
+        if pprime_cache is not None:
+            self.pprime_cache = pprime_cache
         filename = os.path.realpath(filename)
         psafe_exists = os.access(filename, os.F_OK)
         psafe_canwrite = os.access(filename, os.W_OK)
@@ -199,34 +363,39 @@ class PWSafe3:
             log.warn("Asked to create a new psafe but mode is set to RO")
             raise errors.AccessError("Asked to create a new safe in RO mode")
         elif psafe_exists:
-            log.warn("Can't read safe %s" % repr(filename))
+            log.warn("Can't read safe %r", filename)
             raise errors.AccessError("Can't read %s" % filename)
         else:
             log.warn("Safe doesn't exist or can't read directory")
             raise errors.AccessError("No such safe %s" % filename)
         if psafe_exists:
             self.filename = filename
-            log.debug("Loading existing safe from %r" % self.filename)
-            self.fl = open(self.filename, "rb")
-            try:
-                self.flfull = self.fl.read()
-                log.debug("Full data len: %d" % len(self.flfull))
-                self.password = str(password).encode("utf-8")
-                # Read in file
-                self.load()
-            finally:
-                self.fl.close()
+            log.debug("Loading existing safe from %r", self.filename)
+            if iterations is not None or target_unlock_ms is not None:
+                log.warning(
+                    "Ignoring iterations and target_unlock_ms for existing safe %r;"
+                    " use rekey() to change them",
+                    filename,
+                )
+            self.password = str(password).encode("utf-8")
+            # Read in file
+            self.reload()
         else:
             log.debug("New psafe")
-            self.password = str(password)
+            self.password = str(password).encode("utf-8")
             self.filename = filename
             # Init local vars
             # SALT
             self.salt = os.urandom(32)
-            log.debug("Salt is %s" % repr(self.salt))
+            log.debug("Salt is %r", self.salt)
             # ITER
-            self.iter = pow(2, 11)  # 2048
-            log.debug("Iter set to %s" % self.iter)
+            if target_unlock_ms is not None:
+                self.iter = calibrate_iterations(target_unlock_ms)
+            elif iterations is not None:
+                self.iter = iterations
+            else:
+                self.iter = consts.MIN_HASH_ITERATIONS
+            log.debug("Iter set to %s", self.iter)
             # K
             self.enckey = os.urandom(32)
             # L
@@ -234,9 +403,9 @@ class PWSafe3:
             # IV
             self.iv = os.urandom(16)
             # Tag
-            self.tag = "PWS3"
+            self.tag = consts.PSAFE3_TAG
             # EOF
-            self.eof = "PWS3-EOFPWS3-EOF"
+            self.eof = consts.PSAFE3_EOF
             self.headers = []
             self.hmacreq = []
             self.records = []
@@ -245,7 +414,14 @@ class PWSafe3:
             self.autoUpdateHeaders()
 
     def autoUpdateHeaders(self):
-        """Set auto-set headers that should be set on save"""
+        """Set auto-set headers that should be set on save
+
+        Inside batch() this is only done the first time it's called.
+        """
+        if self._batch is not None:
+            if self._batch["headers"]:
+                return
+            self._batch["headers"] = True
         self.setUUID(updateAutoData=False)
         self.setLastSaveApp("pypwsafe", updateAutoData=False)
         self.setTimeStampOfLastSave(datetime.datetime.now(), updateAutoData=False)
@@ -255,31 +431,171 @@ class PWSafe3:
     def __len__(self):
         return len(self.records)
 
-    def save(self):
-        """Save the safe to disk"""
-        if self.mode == "RW":
+    # Working buffers and handles that are rebuilt on load/save
+    _TRANSIENT_ATTRS = (
+        "fl",
+        "flfull",
+        "cryptdata",
+        "fulldata",
+        "hmacreq",
+        "pprime_cache",
+        "write_behind",
+    )
+
+    def __getstate__(self):
+        """Drop the file handle and raw file buffers when pickling."""
+        state = self.__dict__.copy()
+        for attr in self._TRANSIENT_ATTRS:
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def save(self, durability=None):
+        """Save the safe to disk
+
+        The file is written next to the safe and renamed over it, so the
+        safe is never left half written. Step timings go to save_timings.
+        Inside batch() the save is put off until the batch is committed.
+        With a write_behind saver, the save is left to it.
+        @param durability: "none" to skip fsync, "file" to fsync the file, or "dir" to also fsync the directory. Defaults to the durability attribute.
+        @type durability: string
+        """
+        if self.mode == "RW" and self._batch is not None:
+            if durability is not None and durability not in consts.DURABILITY_LEVELS:
+                raise ValueError("Unknown durability %r" % durability)
+            self._batch["save"] = True
+            if durability is not None:
+                self._batch["durability"] = durability
+        elif self.mode == "RW" and self.write_behind is not None:
+            self.write_behind.mark_dirty()
+        elif self.mode == "RW":
+            start = time.perf_counter()
             self.serialiaze()
-            fil = open(self.filename, "w")
-            fil.write(self.flfull.decode("iso8859-1"))
-            fil.close()
+            self._write(self.flfull, durability, time.perf_counter() - start)
         else:
             raise errors.ROSafe("Safe is not in read/write mode")
 
+    def _write(self, data, durability, serialize_time):
+        """Write serialized data over the file and set save_timings.
+
+        @param data: Contents of the file, as left in flfull by serialiaze().
+        @type data: bytes
+        @param durability: One of consts.DURABILITY_LEVELS. Defaults to the durability attribute.
+        @type durability: string
+        @param serialize_time: Seconds it took to serialize data.
+        @type serialize_time: float
+        """
+        if durability is None:
+            durability = self.durability
+        timings = _write_atomic(self.filename, data, durability)
+        timings["total"] = serialize_time + sum(timings.values())
+        timings["serialize"] = serialize_time
+        self.save_timings = timings
+        log.debug("Saved %r with durability %r: %r", self.filename, durability, timings)
+
+    @contextmanager
+    def batch(self, save=True, rollback=True, durability=None):
+        """Make any number of record and header changes as one update.
+
+        The auto-set headers are updated at most once, and the safe is
+        saved once when the block exits instead of on every save() in it.
+        If the block or the save raises, the records and headers lists get
+        back what they held on entry, parsed again from the serialized fields
+        kept then. A batch inside a batch joins it.
+
+        >>> with safe.batch():
+        ...     for r in new_records:
+        ...         safe.records.append(r)
+
+        @param save: Save when the block exits even if save() wasn't called in it.
+        @type save: bool
+        @param rollback: Keep the serialized fields on entry so the records and headers can be restored. Turn off to skip serializing when a failed batch is thrown away.
+        @type rollback: bool
+        @param durability: Durability of the save. Defaults to the one given to save() in the block or the durability attribute.
+        @type durability: string
+        """
+        if self._batch is not None:
+            yield self
+            return
+        if save and self.mode != "RW":
+            raise errors.ROSafe("Safe is not in read/write mode")
+        if durability is not None and durability not in consts.DURABILITY_LEVELS:
+            raise ValueError("Unknown durability %r" % durability)
+        snapshot = None
+        if rollback:
+            snapshot = self._fields()
+        batch = self._batch = dict(headers=False, save=save, durability=durability)
+        try:
+            try:
+                yield self
+            finally:
+                self._batch = None
+            if batch["save"]:
+                self.save(batch["durability"])
+        except BaseException:
+            if snapshot is not None:
+                log.debug("Rolling back batch on %r", self.filename)
+                self._restore_fields(snapshot)
+            raise
+
+    transaction = batch
+
+    def _fields(self):
+        """Return the (type, data) of every header and record field in file order."""
+        fields = [header._field() for header in self.headers]
+        for record in self.records:
+            fields.extend(record._fields())
+        return fields
+
+    def _restore_fields(self, fields):
+        """Parse the headers and records again from the fields of _fields.
+
+        The headers and records lists are refilled in place.
+        """
+        hdrs, records = self.headers, self.records
+        reader = blocks.BlockReader(blocks.pack_fields(fields))
+        self._parse_headers(reader)
+        self._parse_records(reader)
+        hdrs[:], records[:] = self.headers, self.records
+        self.headers, self.records = hdrs, records
+
     def serialiaze(self):
         """Turn the in-memory objects into in-memory strings."""
-        # P'
-        self._regen_pprime()
-        # Regen b1b2
-        self._regen_b1b2()
-        # Regen b3b4
-        self._regen_b3b4()
-        # Regen H(P')
-        self._regen_hpprime()
-        # Regen hmac
-        self.hmac = self.current_hmac()
+        if self._credentials_changed():
+            # P'
+            self._regen_pprime()
+            # Regen b1b2
+            self._regen_b1b2()
+            # Regen b3b4
+            self._regen_b3b4()
+            # Regen H(P')
+            self._regen_hpprime()
+            self._remember_credentials()
+        else:
+            log.debug("Credentials unchanged; reusing P', B1-B4 and H(P')")
+        # The hmac is fed field by field while serializing
+        hm = HMAC(self.hshkey, digestmod=sha256)
 
         log.debug("Loading psafe")
-        self.flfull = pack(
+        preamble = self._pack_preamble()
+        fields = self._fields()
+        for _, data in fields:
+            hm.update(data)
+        self.hmac = hm.digest()
+        # All fields are packed into one buffer
+        self.fulldata = blocks.pack_fields(fields)
+        # Encrypted self.fulldata to self.cryptdata
+        log.debug("Encrypting header/record data %r", self.fulldata)
+        self.encrypt_data()
+        log.debug("Adding crypt data %r", self.cryptdata)
+        self.flfull = b"".join((preamble, self.cryptdata, pack("16s32s", self.eof, self.hmac)))
+        log.debug("Post EOF flfull now %s", (self.flfull,))
+
+    def _pack_preamble(self):
+        """Return the 152 bytes from TAG to IV."""
+        return pack(
             "4s32sI32s32s32s16s",
             self.tag,
             self.salt,
@@ -289,42 +605,90 @@ class PWSafe3:
             self.b3b4,
             self.iv,
         )
-        log.debug("Pre-header flfull now %s", (self.flfull,))
-        self.fulldata = b""
-        for header in self.headers:
-            self.fulldata += header.serialiaze()
-            # log.debug("In header flfull now %s",(self.flfull,))
-        for record in self.records:
-            self.fulldata += record.serialiaze()
-            # log.debug("In record flfull now %s",(self.flfull,))
-        # Encrypted self.fulldata to self.cryptdata
-        log.debug("Encrypting header/record data %s" % repr(self.fulldata))
-        self.encrypt_data()
-        self.flfull += self.cryptdata
-        log.debug("Adding crypt data %s" % repr(self.cryptdata))
-        self.flfull += pack("16s32s", self.eof, self.hmac)
-        log.debug("Post EOF flfull now %s", (self.flfull,))
+
+    def rekey(self, new_password, new_iter=None):
+        """Change the master password and/or the number of key stretch iterations.
+
+        K and L stay the same, so only the salt, ITER, H(P') and B1 - B4 change.
+        The 152 byte preamble of the file is rewritten in place; the encrypted
+        headers and records and the HMAC are left untouched. Unsaved changes
+        to headers or records are not written. The safe is locked while the
+        file is rewritten, and SafeChangedError is raised if its preamble is no
+        longer the one this safe was loaded or saved with.
+        @param new_password: The new password for the safe.
+        @type new_password: string
+        @param new_iter: The new number of stretch iterations. Keeps the current count if not given.
+        @type new_iter: int
+        """
+        if self.mode != "RW":
+            raise errors.ROSafe("Safe is not in read/write mode")
+        if new_iter is not None:
+            _check_iterations(new_iter)
+        if not os.access(self.filename, os.F_OK):
+            self._rekey(new_password, new_iter)
+            return
+        locked_here = not self.locked
+        if locked_here:
+            self.lock()
+        try:
+            with open(self.filename, "r+b") as fil:
+                # The file must still wrap the K and L held here
+                current = fil.read(consts.PREAMBLE_SIZE)
+                if self._credentials is None or current != self._pack_preamble():
+                    raise errors.SafeChangedError(
+                        "%s was changed since it was loaded" % self.filename
+                    )
+                preamble = self._rekey(new_password, new_iter)
+                log.debug("Rewriting preamble of %r", self.filename)
+                fil.seek(0)
+                fil.write(preamble)
+                fil.flush()
+                os.fsync(fil.fileno())
+        finally:
+            if locked_here:
+                self.unlock()
+
+    def _rekey(self, new_password, new_iter):
+        """Derive the new credentials and return the new preamble."""
+        self.password = str(new_password).encode("utf-8")
+        self.salt = os.urandom(32)
+        if new_iter is not None:
+            self.iter = new_iter
+        self._regen_pprime()
+        self._regen_b1b2()
+        self._regen_b3b4()
+        self._regen_hpprime()
+        self._remember_credentials()
+        preamble = self._pack_preamble()
+        if self.flfull:
+            self.flfull = preamble + self.flfull[len(preamble):]
+        return preamble
+
+    def _credentials_snapshot(self):
+        return (self.password, self.salt, self.iter, self.enckey, self.hshkey)
+
+    def _remember_credentials(self):
+        """Record the inputs P', B1-B4 and H(P') were last derived from."""
+        self._credentials = self._credentials_snapshot()
+
+    def _credentials_changed(self):
+        """True if P', B1-B4 or H(P') must be regenerated before saving."""
+        return self._credentials != self._credentials_snapshot()
 
     def _regen_pprime(self):
         """Regenerate P'. This is the stretched version of salt and password."""
         self.pprime = stretchkey(self.password, self.salt, self.iter)
-        log.debug("P' = % s" % repr(self.pprime))
+        log.debug("P' = %r", self.pprime)
 
     def _regen_b1b2(self):
         """Regenerate b1 and b2. This is the encrypted form of K."""
-        tw = Cipher(b"TWOFISH", "ECB")
-        # HTU tw.init(self.pprime)
-        tw.key = self.pprime
-        self.b1b2 = tw.encrypt(self.enckey)
-        log.debug("B1/B2 set to %s" % repr(self.b1b2))
+        self.b1b2 = ciphers.get_backend().ecb_encrypt(self.pprime, self.enckey)
+        log.debug("B1/B2 set to %r", self.b1b2)
 
     def _regen_b3b4(self):
         """Regenerate b3 and b4. This is the encrypted form of L."""
-        tw = Cipher(b"TWOFISH", "ECB")
-        # HTU tw.init(self.pprime)
-        tw.key = self.pprime
-        self.b3b4 = tw.encrypt(self.hshkey)
-        log.debug("B3/B4 set to %s" % repr(self.b3b4))
+        self.b3b4 = ciphers.get_backend().ecb_encrypt(self.pprime, self.hshkey)
+        log.debug("B3/B4 set to %r", self.b3b4)
 
     def _regen_hpprime(self):
         """Regenerate H(P')
@@ -333,9 +697,27 @@ class PWSafe3:
         hsh = sha256()
         hsh.update(self.pprime)
         self.hpprime = hsh.digest()
-        log.debug("Set H(P') to % s" % repr(self.hpprime))
+        log.debug("Set H(P') to %r", self.hpprime)
         assert self.check_password()
 
+    def reload(self):
+        """Re-read the safe from disk, discarding in-memory changes."""
+        self.fl = open(self.filename, "rb")
+        try:
+            if self.headers_only:
+                self.load_headers(self.fl)
+            elif self.mmap:
+                with _mmap.mmap(self.fl.fileno(), 0, access=_mmap.ACCESS_READ) as mapped:
+                    self.load_mapped(mapped)
+            elif self.stream:
+                self.load_stream(self.fl)
+            else:
+                self.flfull = self.fl.read()
+                log.debug("Full data len: %d", len(self.flfull))
+                self.load()
+        finally:
+            self.fl.close()
+
     def load(self):
         """Load a psafe3 file
         Will raise PasswordError if the password is bad.
@@ -355,7 +737,108 @@ class PWSafe3:
         HMAC    32    BIN
         """
         log.debug("Loading psafe")
-        log.debug("len: %d flful: %r" % (len(self.flfull[:152]), self.flfull[:152]))
+        self._unpack_preamble(self.flfull[:consts.PREAMBLE_SIZE])
+        self.cryptdata = self.flfull[consts.PREAMBLE_SIZE:-consts.TRAILER_SIZE]
+        self._unpack_trailer(self.flfull[-consts.TRAILER_SIZE:])
+        self._unlock_keys()
+        log.debug("Going to decrypt data")
+        self.decrypt_data()
+        self._parse_body(blocks.BlockReader(self.fulldata))
+
+    def load_stream(self, fl):
+        """Load a psafe3 file from an open file, chunk by chunk.
+
+        Ciphertext is read and decrypted stream_chunk_size bytes at a time
+        and fed straight to the parsers, so flfull, cryptdata and fulldata
+        are not kept.
+        @param fl: File opened in binary mode
+        @type fl: File Handle
+        """
+        log.debug("Streaming psafe")
+        size = os.fstat(fl.fileno()).st_size
+        fl.seek(0)
+        self._unpack_preamble(fl.read(consts.PREAMBLE_SIZE))
+        fl.seek(size - consts.TRAILER_SIZE)
+        self._unpack_trailer(fl.read(consts.TRAILER_SIZE))
+        self._unlock_keys()
+        self.flfull = self.cryptdata = self.fulldata = None
+        fl.seek(consts.PREAMBLE_SIZE)
+        chunks = blocks.read_chunks(fl, size - consts.PREAMBLE_SIZE - consts.TRAILER_SIZE, self.stream_chunk_size)
+        tw = ciphers.get_backend()
+        self._parse_body(
+            blocks.ChunkedBlockReader(tw.cbc_decrypt_chunks(self.enckey, self.iv, chunks))
+        )
+
+    def load_headers(self, fl):
+        """Load only the headers of a psafe3 file from an open file.
+
+        Ciphertext is decrypted a few blocks at a time until the EOF header.
+        No records are read and the HMAC is not verified; hmac_verified is
+        set to False.
+        @param fl: File opened in binary mode
+        @type fl: File Handle
+        """
+        log.debug("Loading psafe headers")
+        size = os.fstat(fl.fileno()).st_size
+        fl.seek(0)
+        self._unpack_preamble(fl.read(consts.PREAMBLE_SIZE))
+        fl.seek(size - consts.TRAILER_SIZE)
+        self._unpack_trailer(fl.read(consts.TRAILER_SIZE))
+        self._unlock_keys()
+        self.flfull = self.cryptdata = self.fulldata = None
+        fl.seek(consts.PREAMBLE_SIZE)
+        chunks = blocks.read_chunks(fl, size - consts.PREAMBLE_SIZE - consts.TRAILER_SIZE, blocks.HEADERS_CHUNK_SIZE)
+        tw = ciphers.get_backend()
+        reader = blocks.ChunkedBlockReader(
+            tw.cbc_decrypt_chunks(self.enckey, self.iv, chunks)
+        )
+        try:
+            self._parse_headers(reader)
+        except EOFError:
+            log.error("Safe data ended unexpectedly at offset %d", reader.offset)
+            raise
+        self.records = []
+        self.hmac_verified = False
+        log.debug("Only headers of %r loaded; HMAC not verified", self.filename)
+
+    def load_mapped(self, mapped):
+        """Load a psafe3 file from a read-only memory map of it.
+
+        The preamble and trailer are unpacked from the mapping and the
+        ciphertext is handed to the cipher backend as a memoryview, so the
+        file is never copied. With stream set, it is decrypted chunk by chunk.
+        No reference to the mapping is kept; it can be closed afterwards.
+        @param mapped: Map of the whole file
+        @type mapped: mmap.mmap
+        """
+        log.debug("Loading mapped psafe")
+        with memoryview(mapped) as view:
+            self._unpack_preamble(view[:consts.PREAMBLE_SIZE])
+            self._unpack_trailer(view[-consts.TRAILER_SIZE:])
+            self._unlock_keys()
+            self.flfull = self.cryptdata = self.fulldata = None
+            tw = ciphers.get_backend()
+            if self.stream:
+                size = self.stream_chunk_size - self.stream_chunk_size % 16
+                end = len(view) - consts.TRAILER_SIZE
+                chunks = (
+                    view[pos:min(pos + size, end)]
+                    for pos in range(consts.PREAMBLE_SIZE, end, size)
+                )
+                reader = blocks.ChunkedBlockReader(
+                    tw.cbc_decrypt_chunks(self.enckey, self.iv, chunks)
+                )
+            else:
+                self.fulldata = tw.cbc_decrypt(
+                    self.enckey, self.iv, view[consts.PREAMBLE_SIZE:-consts.TRAILER_SIZE]
+                )
+                reader = blocks.BlockReader(self.fulldata)
+            self._parse_body(reader)
+
+    def _unpack_preamble(self, preamble):
+        if log.isEnabledFor(logging.DEBUG):
+            # preamble may be a view of a mapping; log records must not keep it
+            log.debug("len: %d preamble: %r", len(preamble), bytes(preamble))
         (
             self.tag,
             self.salt,
@@ -364,137 +847,177 @@ class PWSafe3:
             self.b1b2,
             self.b3b4,
             self.iv,
-        ) = unpack("4s32sI32s32s32s16s", self.flfull[:152])
-        log.debug("Tag: %s" % repr(self.tag))
-        log.debug("Salt: %s" % repr(self.salt))
-        log.debug("Iter: %s" % repr(self.iter))
-        log.debug("H(P'): % s" % repr(self.hpprime))
-        log.debug("B1B2: % s" % repr(self.b1b2))
-        log.debug("B3B4: % s" % repr(self.b3b4))
-        log.debug("IV: % s" % repr(self.iv))
-        self.cryptdata = self.flfull[152:-48]
-        (self.eof, self.hmac) = unpack("16s32s", self.flfull[-48:])
-        log.debug("EOF: % s" % repr(self.eof))
-        log.debug("HMAC: % s" % repr(self.hmac))
+        ) = unpack("4s32sI32s32s32s16s", preamble)
+        log.debug("Tag: %r", self.tag)
+        log.debug("Salt: %r", self.salt)
+        log.debug("Iter: %r", self.iter)
+        log.debug("H(P'): %r", self.hpprime)
+        log.debug("B1B2: %r", self.b1b2)
+        log.debug("B3B4: %r", self.b3b4)
+        log.debug("IV: %r", self.iv)
+
+    def _unpack_trailer(self, trailer):
+        (self.eof, self.hmac) = unpack("16s32s", trailer)
+        log.debug("EOF: %r", self.eof)
+        log.debug("HMAC: %r", self.hmac)
+
+    def _unlock_keys(self):
+        """Check the password and derive K and L. Raises PasswordError."""
         # Determine the password hash
         self.update_pprime()
         # Verify password
         if not self.check_password():
+            if self.pprime_cache is not None:
+                self.pprime_cache.discard(self.password, self.salt, self.iter)
             raise errors.PasswordError
+        if self.pprime_cache is not None:
+            self.pprime_cache.put(self.password, self.salt, self.iter, self.pprime)
         # Figure out the encryption and hash session keys
         log.debug("Calc'ing keys")
         self.calc_keys()
-        log.debug("Going to decrypt data")
-        self.decrypt_data()
+        self._remember_credentials()
+
+    def _parse_body(self, reader):
+        """Parse headers and records from decrypted blocks and check the HMAC.
+
+        @param reader: Source of the decrypted blocks
+        @type reader: blocks.BlockReader
+        """
+        try:
+            self._parse_fields(reader)
+        except EOFError:
+            log.error("Safe data ended unexpectedly at offset %d", reader.offset)
+            raise
+
+    def _parse_fields(self, reader):
+        # The hmac covers the field data as read, fed in as it is parsed
+        hm = HMAC(self.hshkey, digestmod=sha256)
+        self._parse_headers(reader, hm)
+        self._parse_records(reader, hm)
+
+        calculated = hm.digest()
+        if not compare_digest(calculated, self.hmac):
+            log.error(
+                "Invalid HMAC Calculated: %s File: %s"
+                % (repr(calculated), repr(self.hmac))
+            )
+            raise errors.InvalidHMACError(
+                "Calculated: % s File: % s" % (repr(calculated), repr(self.hmac))
+            )
+        self.hmac_verified = True
 
-        # Parse headers
+    def _parse_headers(self, reader, hm=None):
+        """Parse headers up to and including the EOF header."""
         self.headers = []
         self.hmacreq = []
-        self.remaining_headers = self.fulldata
-        hdr = headers.Create_Header(self._fetch_block)
+        hdr = headers.Create_Header(reader)
         self.headers.append(hdr)
         self.hmacreq.append(hdr.hmac_data)
+        if hm is not None:
+            hm.update(hdr.data)
         # print str(hdr) +" - -"+ repr(hdr)
         while type(hdr) != headers.EOFHeader:
-            hdr = headers.Create_Header(self._fetch_block)
+            hdr = headers.Create_Header(reader)
             self.headers.append(hdr)
+            if hm is not None:
+                hm.update(hdr.data)
             # print str(hdr) +" - -"+ repr(hdr)
 
-        # Parse DB
+    def _parse_records(self, reader, hm=None):
+        """Parse records until the blocks run out."""
         self.records = []
-        while len(self.remaining_headers) > 0:
-            req = Record(self._fetch_block)
+        record_type = LazyRecord if self.lazy else Record
+        while reader.has_more():
+            req = record_type(reader, hmac_obj=hm)
             self.records.append(req)
 
-        if self.current_hmac(cached=True) != self.hmac:
-            log.error(
-                "Invalid HMAC Calculated: %s File: %s"
-                % (repr(self.current_hmac()), repr(self.hmac))
-            )
-            raise errors.InvalidHMACError(
-                "Calculated: % s File: % s"
-                % (repr(self.current_hmac()), repr(self.hmac))
-            )
-
     def __str__(self):
         ret = ""
         for i in self.records:
             ret += str(i) + "\n\n"
         return ret
 
-    def _fetch_block(self, num_blocks=1):
-        """Returns one or more 16 - byte block of data.
-
-        Raises EOFError when there is no more data.
-        """
-        num_blocks = int(num_blocks)
-        num_bytes = num_blocks * 16
-        if num_bytes > len(self.remaining_headers):
-            raise EOFError("No more header data")
-        ret = self.remaining_headers[:num_bytes]
-        self.remaining_headers = self.remaining_headers[num_bytes:]
-        return ret
-
     def calc_keys(self):
         """Calculate sessions keys for encryption and hmac.
 
         Is based on pprime, b1b2, b3b4.
         """
-        tw = Cipher(b"TWOFISH", "ECB")
-        # HTU tw.init(self.pprime)
-        tw.key = self.pprime
-        self.enckey = tw.decrypt(self.b1b2)
-        # its ok to reuse; ecb doesn't keep state info
-        self.hshkey = tw.decrypt(self.b3b4)
-        log.debug("Encryption key K: %s " % repr(self.enckey))
-        log.debug("HMAC Key L: %s " % repr(self.hshkey))
+        tw = ciphers.get_backend()
+        self.enckey = tw.ecb_decrypt(self.pprime, self.b1b2)
+        self.hshkey = tw.ecb_decrypt(self.pprime, self.b3b4)
+        log.debug("Encryption key K: %r ", self.enckey)
+        log.debug("HMAC Key L: %r ", self.hshkey)
 
     def decrypt_data(self):
         """Decrypt encrypted portion of header and data."""
-        log.debug("Creating mcrypt object")
-        tw = Cipher(b"TWOFISH", "CBC")
-        log.debug("Adding key & iv")
-        # HTU tw.init(self.enckey, self.iv)
-        tw.key = self.enckey
-        tw.iv = self.iv
-        log.debug("Decrypting data")
-        self.fulldata = tw.decrypt(self.cryptdata)
+        tw = ciphers.get_backend()
+        log.debug("Decrypting data with %r", tw)
+        self.fulldata = tw.cbc_decrypt(self.enckey, self.iv, self.cryptdata)
 
     def encrypt_data(self):
         """Encrypted fulldata to cryptdata."""
-        tw = Cipher(b"TWOFISH", "CBC")
-        # HTU tw.init(self.enckey, self.iv)
-        tw.key = self.enckey
-        tw.iv = self.iv
-        self.cryptdata = tw.encrypt(self.fulldata)
+        tw = ciphers.get_backend()
+        self.cryptdata = tw.cbc_encrypt(self.enckey, self.iv, self.fulldata)
 
     def current_hmac(self, cached=False):
-        """Returns the current hmac of self.fulldata."""
-        data = b""
+        """Returns the current hmac of the headers and records.
+
+        The data of each header and record field is fed to the hmac in turn.
+        @param cached: Use the header data as read from the file instead of reserializing the headers.
+        @type cached: bool
+        """
+        log.debug("Building hmac with key %r", self.hshkey)
+        hm = HMAC(self.hshkey, digestmod=sha256)
         for i in self.headers:
-            log.debug(
-                "Adding hmac data %r from %r" % (i.hmac_data(), i.__class__.__name__)
-            )
             if cached:
-                data += i.data
+                hm.update(i.data)
             else:
-                d = i.hmac_data()
-                if isinstance(d, str):
-                    d = d.encode("us-ascii")
-                data += d
-                # assert i.data == i.hmac_data(), "Working on %r where %r!=%r" % (i, i.data, i.hmac_data())
+                hm.update(_hmac_bytes(i.hmac_data()))
         for i in self.records:
-            # TODO: Add caching support
-            log.debug(
-                "Adding hmac data %r from %r" % (i.hmac_data(), i.__class__.__name__)
-            )
-            data += i.hmac_data()
-        log.debug("Building hmac with key %s", repr(self.hshkey))
-        hm = HMAC(self.hshkey, data, sha256)
-        # print hm.hexdigest()
-        log.debug("HMAC %s-%s", repr(hm.hexdigest()), repr(hm.digest()))
+            i.update_hmac(hm)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("HMAC %r-%r", hm.hexdigest(), hm.digest())
         return hm.digest()
 
+    @classmethod
+    def verify_password(cls, filename, password, pprime_cache=None):
+        """Check a password against a safe without decrypting it.
+
+        Only the 152 byte preamble is read. The key is stretched and compared
+        against H(P'); K, L, headers, records and the HMAC are not touched.
+        @param filename: The path to the Password Safe file.
+        @type filename: string
+        @param password: The password to check.
+        @type password: string
+        @param pprime_cache: Cache to look up P' in. Defaults to the class-wide cache.
+        @type pprime_cache: PPrimeCache
+        @rtype: bool
+        @return: True if the password opens the safe.
+        @raise NotASafeError: The file doesn't start with a psafe3 preamble, or its ITER is below the format minimum.
+        """
+        with open(filename, "rb") as fil:
+            preamble = fil.read(consts.PREAMBLE_SIZE)
+        if len(preamble) != consts.PREAMBLE_SIZE or preamble[:4] != consts.PSAFE3_TAG:
+            raise errors.NotASafeError("%s is not a psafe3 file" % filename)
+        (salt, iterations, hpprime) = unpack("32sI32s", preamble[4:72])
+        if iterations < consts.MIN_HASH_ITERATIONS:
+            raise errors.NotASafeError(
+                "%s has %d key stretch iterations, below the minimum of %d"
+                % (filename, iterations, consts.MIN_HASH_ITERATIONS)
+            )
+        password = str(password).encode("utf-8")
+        if pprime_cache is None:
+            pprime_cache = cls.pprime_cache
+        pprime = None
+        if pprime_cache is not None:
+            pprime = pprime_cache.get(password, salt, iterations)
+        if pprime is None:
+            pprime = stretchkey(password, salt, iterations)
+        matches = compare_digest(sha256(pprime).digest(), hpprime)
+        if matches and pprime_cache is not None:
+            pprime_cache.put(password, salt, iterations, pprime)
+        return matches
+
     def check_password(self):
         """Check that the hash in self.pprime matches what's in the password safe. True if password matches hash in hpprime. False otherwise"""
         hsh = sha256()
@@ -503,11 +1026,19 @@ class PWSafe3:
 
     def update_pprime(self):
         """Update self.pprime. This key is used to decrypt B1 / 2 and B3 / 4"""
+        if self.pprime_cache is not None:
+            pprime = self.pprime_cache.get(self.password, self.salt, self.iter)
+            if pprime is not None:
+                log.debug("Using cached P'")
+                self.pprime = pprime
+                return
         self.pprime = stretchkey(self.password, self.salt, self.iter)
 
     def close(self):
         """Close out open file"""
-        self.fl.close()
+        # Unpickled safes have no file
+        if self.fl is not None:
+            self.fl.close()
 
     def __del__(self):
         try:
@@ -788,7 +1319,18 @@ class PWSafe3:
         NFS/CIFS/etc then users of the share should be able to read/write/lock/unlock
         psafe files.
         Note: No gurentee that this will work in Windows
+        Note: A lock file left by a dead process on this host is removed and
+        taken over. A lock of a live process, of another host or with
+        unreadable contents raises AlreadyLockedError.
+        Note: With a write_behind saver, this waits for a save in progress.
         """
+        if self.write_behind is not None:
+            self.write_behind.lock()
+        else:
+            self._lock()
+
+    def _lock(self):
+        """Create the lock file. See lock."""
 
         # Use splitext() to handle the case where the file may not have psafe3 ext or any extension at all.
         # Note the full path of filename is not lost when the extension is split off.
@@ -805,28 +1347,31 @@ class PWSafe3:
             # May be a dead pid
             log.debug("Lock file already exists. Reading it. ")
             f = open(lfile, "rb")
-            data = f.read()
+            data = f.read().decode("utf-8", "replace")
             f.close()
             found = self.LOCKFILE_PARSE_RE.findall(data)
             log.debug("Got %r from the lock", found)
             if len(found) == 1:
                 (lusername, lhostname, lpid) = found[0]
-                if lhostname == socket.gethostbyname():
+                if lhostname == socket.gethostname():
                     try:  # Check if the other proc is still alive
-                        os.kill(lpid, 0)
-                        log.info(
-                            "Other process (PID: %r) is alive. Can't override lock for %r ",
-                            lpid,
-                            self,
-                        )
-                        raise errors.AlreadyLockedError(
-                            "Other process is alive. Can't override lock. "
-                        )
-                    except Exception:
+                        os.kill(int(lpid), 0)
+                    except ProcessLookupError:
                         # Not really locked, remove stale lock
                         log.warning("Removing stale lock file of %r at %r", self, lfile)
                         os.remove(lfile)
-                        return self.lock()
+                        return self._lock()
+                    except OSError:
+                        # Exists but belongs to someone else
+                        pass
+                    log.info(
+                        "Other process (PID: %r) is alive. Can't override lock for %r ",
+                        lpid,
+                        self,
+                    )
+                    raise errors.AlreadyLockedError(
+                        "Other process is alive. Can't override lock. "
+                    )
                 else:
                     log.info(
                         "Lock file is for a different host (%r). Assuming %r is locked. ",
@@ -845,22 +1390,28 @@ class PWSafe3:
                 raise errors.AlreadyLockedError(
                     "Lock file contains invalid data. Assuming the safe is already locked. "
                 )
-        self.locked = lfile
-
         # Create the lock file with no race conditions
         # Should generate an OS error if the file already exists
         try:
             fd = os.open(lfile, os.O_CREAT | os.O_EXCL | os.O_RDWR)
-            os.write(fd, self._get_lock_data())
+            os.write(fd, self._get_lock_data().encode("utf-8"))
             os.close(fd)
         except OSError:
             log.info("%r reported as unlocked but can't create the lockfile", self)
             raise errors.AlreadyLockedError
+        self.locked = lfile
 
     def unlock(self):
         """Unlock the DB
         Note: See lock method for important locking info.
         """
+        if self.write_behind is not None:
+            self.write_behind.unlock()
+        else:
+            self._unlock()
+
+    def _unlock(self):
+        """Remove the lock file. See unlock."""
         if not self.locked:
             log.info("%r is not locked. Failing to unlock. ", self)
             raise errors.NotLockedError("Not currently locked")
@@ -895,12 +1446,63 @@ class PWSafe3:
 
 
 # Misc helper functions
+def _open_for_batch(filename, password, mode):
+    """Open a safe in a worker process. Errors are returned, not raised."""
+    try:
+        return PWSafe3(filename=filename, password=password, mode=mode), None
+    except Exception as e:
+        log.info("Failed to open %r: %r", filename, e)
+        return None, e
+
+
+def open_many(safes, workers=None, mode="RO"):
+    """Open many safes in parallel worker processes.
+
+    Key stretching, decryption and parsing run in a process pool so they
+    aren't serialized by the GIL. A safe that fails to open doesn't stop
+    the others.
+    @param safes: The safes to open.
+    @type safes: [(filename, password),...]
+    @param workers: Number of worker processes. Defaults to the number of CPUs.
+    @type workers: int
+    @param mode: Read only or read/write mode for all safes. "RO" or "RW".
+    @type mode: string
+    @rtype: ({filename: PWSafe3}, {filename: Exception})
+    @return: The opened safes and the errors of the ones that failed, both keyed by filename as given.
+    @raise ValueError: A filename is given more than once.
+    """
+    safes = list(safes)
+    seen = set()
+    for filename, _ in safes:
+        if filename in seen:
+            raise ValueError("%s is given more than once" % filename)
+        seen.add(filename)
+    opened = {}
+    failed = {}
+    if not safes:
+        return opened, failed
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (filename, executor.submit(_open_for_batch, filename, password, mode))
+            for filename, password in safes
+        ]
+        for filename, future in futures:
+            try:
+                safe, error = future.result()
+            except Exception as e:
+                # Worker died or the result couldn't be transferred
+                safe, error = None, e
+            if error is None:
+                opened[filename] = safe
+            else:
+                failed[filename] = error
+    return opened, failed
+
+
 def ispsafe3(filename):
     """Return True if the file appears to be a psafe v3 file. Does not do in-depth checks."""
-    fil = open(filename, "r")
-    data = fil.read(4)
-    fil.close()
-    return data == "PWS3"
+    with open(filename, "rb") as fil:
+        return fil.read(4) == consts.PSAFE3_TAG
 
 
 if __name__ == "__main__":
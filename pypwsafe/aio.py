@@ -0,0 +1,108 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Asyncio interface to Password Safe v3 files.
+
+Key stretching, encryption, parsing and file I/O run in an executor so the
+event loop keeps serving other tasks while a safe is opened or saved.
+"""
+
+import asyncio
+import functools
+import logging
+
+from . import PWSafe3
+
+
+log = logging.getLogger("psafe.lib.aio")
+log.debug("initing")
+
+
+class AsyncPWSafe3:
+    """Awaitable wrapper around a PWSafe3 object.
+
+    Blocking operations of one safe are run one at a time. Other attributes
+    and methods are those of the wrapped safe.
+
+    safe        PWSafe3      The wrapped safe
+    executor    Executor     Executor to run blocking calls in. None for the loop's default.
+    """
+
+    def __init__(self, safe, executor=None):
+        self.safe = safe
+        self.executor = executor
+        self._busy = None
+
+    @classmethod
+    async def open(cls, filename, password, mode="RW", executor=None, **kwargs):
+        """Open or create a safe without blocking the event loop.
+
+        Takes the same arguments as PWSafe3.
+        """
+        safe = await _run_in_executor(
+            executor, PWSafe3, filename, password, mode=mode, **kwargs
+        )
+        return cls(safe, executor)
+
+    async def _run(self, func, *args, **kwargs):
+        if self._busy is None:
+            self._busy = asyncio.Lock()
+        async with self._busy:
+            return await _run_in_executor(self.executor, func, *args, **kwargs)
+
+    async def load(self):
+        """Re-read the safe from disk. See PWSafe3.reload."""
+        await self._run(self.safe.reload)
+
+    async def save(self, durability=None):
+        """Save the safe to disk. See PWSafe3.save."""
+        await self._run(self.safe.save, durability)
+
+    async def lock(self):
+        """Acquire the lock file of the safe. See PWSafe3.lock."""
+        await self._run(self.safe.lock)
+
+    async def unlock(self):
+        """Release the lock file of the safe. See PWSafe3.unlock."""
+        await self._run(self.safe.unlock)
+
+    def __getattr__(self, attr):
+        return getattr(self.safe, attr)
+
+    def __len__(self):
+        return len(self.safe)
+
+    def __getitem__(self, *args, **kwargs):
+        return self.safe.__getitem__(*args, **kwargs)
+
+    def __repr__(self):
+        return "AsyncPWSafe3(%r)" % self.safe.filename
+
+
+async def aopen(filename, password, mode="RW", executor=None, **kwargs):
+    """Open or create a safe without blocking the event loop.
+
+    @rtype: AsyncPWSafe3
+    """
+    return await AsyncPWSafe3.open(
+        filename, password, mode=mode, executor=executor, **kwargs
+    )
+
+
+async def _run_in_executor(executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,162 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Block readers feeding decrypted data to the header and record parsers,
+and the packing of serialized fields into blocks."""
+
+import logging
+import os
+from struct import Struct
+
+
+log = logging.getLogger("psafe.lib.blocks")
+log.debug("initing")
+
+BLOCK_SIZE = 16
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Headers are rarely more than a few blocks long
+HEADERS_CHUNK_SIZE = 1024
+
+# Length and type of a field
+_FIELD_HEADER = Struct("=lB")
+
+
+def padded_len(length):
+    """Bytes taken by a field with length bytes of data, including type+len."""
+    return (length + _FIELD_HEADER.size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+
+
+def pack_fields(fields):
+    """Return the (type, data) fields with their type+len and random padding.
+
+    The output bytearray is allocated once, and the padding of all the
+    fields is drawn with a single os.urandom call.
+    @param fields: Type id and data of each field
+    @type fields: [(int, bytes)]
+    """
+    if not isinstance(fields, list):
+        fields = list(fields)
+    size = 0
+    used = 0
+    for _, data in fields:
+        size += padded_len(len(data))
+        used += _FIELD_HEADER.size + len(data)
+    out = bytearray(size)
+    padding = os.urandom(size - used)
+    pos = 0
+    pad_pos = 0
+    for ftype, data in fields:
+        _FIELD_HEADER.pack_into(out, pos, len(data), ftype)
+        pos += _FIELD_HEADER.size
+        end = pos + len(data)
+        out[pos:end] = data
+        pad = -end % BLOCK_SIZE
+        out[end:end + pad] = padding[pad_pos:pad_pos + pad]
+        pad_pos += pad
+        pos = end + pad
+    return out
+
+
+def read_chunks(fl, length, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield length bytes from the current position of fl, chunk_size at a time.
+
+    chunk_size is rounded down to whole blocks.
+    """
+    chunk_size = max(BLOCK_SIZE, chunk_size - chunk_size % BLOCK_SIZE)
+    while length > 0:
+        chunk = fl.read(min(chunk_size, length))
+        if not chunk:
+            raise EOFError("File is shorter than expected")
+        length -= len(chunk)
+        yield chunk
+
+
+class BlockReader:
+    """Hand out 16-byte blocks from a buffer.
+
+    A cursor moves over a memoryview of the data, so only the returned
+    blocks are copied.
+
+    offset    int        Number of bytes handed out so far
+    """
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self.offset = 0
+
+    def __call__(self, num_blocks=1):
+        """Returns one or more 16-byte blocks of data.
+
+        Raises EOFError when there is no more data.
+        """
+        num_bytes = int(num_blocks) * BLOCK_SIZE
+        end = self.offset + num_bytes
+        if end > len(self._view):
+            raise EOFError("No more header data")
+        ret = self._view[self.offset:end].tobytes()
+        self.offset = end
+        return ret
+
+    def has_more(self):
+        """True if there is at least one more block."""
+        return self.offset + BLOCK_SIZE <= len(self._view)
+
+
+class ChunkedBlockReader:
+    """Hand out 16-byte blocks from an iterable of data chunks.
+
+    Chunks are pulled only when the pending data runs out, and dropped once
+    all their blocks have been handed out.
+
+    offset    int        Number of bytes handed out so far
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._pos = 0
+        self.offset = 0
+
+    def _fill(self, num_bytes):
+        """Make sure num_bytes are pending. Returns False if the data ran out."""
+        while len(self._buffer) - self._pos < num_bytes:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                return False
+            self._buffer = self._buffer[self._pos:] + chunk
+            self._pos = 0
+        return True
+
+    def __call__(self, num_blocks=1):
+        """Returns one or more 16-byte blocks of data.
+
+        Raises EOFError when there is no more data.
+        """
+        num_bytes = int(num_blocks) * BLOCK_SIZE
+        if not self._fill(num_bytes):
+            raise EOFError("No more header data")
+        ret = self._buffer[self._pos:self._pos + num_bytes]
+        self._pos += num_bytes
+        self.offset += num_bytes
+        return ret
+
+    def has_more(self):
+        """True if there is at least one more block."""
+        return self._fill(BLOCK_SIZE)
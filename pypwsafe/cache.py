@@ -0,0 +1,110 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""In-process cache of stretched keys."""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from hmac import new as HMAC
+
+
+log = logging.getLogger("psafe.lib.cache")
+log.debug("initing")
+
+
+class PPrimeCache:
+    """An LRU cache of P' values with a time-to-live.
+
+    Entries are keyed by (salt, iterations, HMAC(secret, password)) where
+    the secret is random per cache, so the cache never holds the password
+    or a plain hash of it. Cached keys are kept in bytearrays so that
+    purge() can overwrite them.
+
+    ttl        float        Seconds an entry stays valid. None for no expiry.
+    maxsize    int          Maximum number of entries
+    """
+
+    def __init__(self, ttl=300, maxsize=128, clock=time.monotonic):
+        assert maxsize > 0
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, password, salt, iterations):
+        digest = HMAC(self._secret, password, sha256).digest()
+        return (bytes(salt), int(iterations), digest)
+
+    def get(self, password, salt, iterations):
+        """Return the cached P' or None if there is no valid entry."""
+        key = self._key(password, salt, iterations)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, pprime = entry
+            if expires is not None and expires <= self.clock():
+                log.debug("Cached P' expired")
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return bytes(pprime)
+
+    def put(self, password, salt, iterations, pprime):
+        """Store a verified P'. Evicts the least recently used entries."""
+        key = self._key(password, salt, iterations)
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (expires, bytearray(pprime))
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def discard(self, password, salt, iterations):
+        """Remove and zeroize a single entry, if present."""
+        with self._lock:
+            self._discard(self._key(password, salt, iterations))
+
+    def expire(self):
+        """Remove and zeroize all expired entries."""
+        now = self.clock()
+        with self._lock:
+            for key, (expires, _) in list(self._entries.items()):
+                if expires is not None and expires <= now:
+                    self._discard(key)
+
+    def purge(self):
+        """Remove and zeroize all entries."""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            pprime = entry[1]
+            pprime[:] = bytes(len(pprime))
+
+    def __len__(self):
+        return len(self._entries)
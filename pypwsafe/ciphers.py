@@ -0,0 +1,181 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Twofish cipher backends.
+
+Backends register themselves by NAME; the available backend with the highest
+PRIORITY is used unless one is selected with set_backend. All methods take
+and return whole 16-byte blocks and never modify their input.
+"""
+
+import logging
+
+from . import twofish
+from .registry import RegisteredType, Registry
+
+
+log = logging.getLogger("psafe.lib.ciphers")
+log.debug("initing")
+
+_registry = Registry("cipher backend")
+backends = _registry.classes
+
+
+class CipherBackend(metaclass=RegisteredType):
+    """A Twofish implementation. Should be extended.
+
+    NAME        string        Name used to select the backend
+    PRIORITY    int           Backends with higher values are preferred
+    """
+
+    REGISTRY = _registry
+    NAME = None
+    PRIORITY = 0
+
+    @classmethod
+    def available(cls):
+        """Return True if the backend can be used on this host."""
+        return True
+
+    def ecb_encrypt(self, key, data):
+        raise NotImplementedError
+
+    def ecb_decrypt(self, key, data):
+        raise NotImplementedError
+
+    def cbc_encrypt(self, key, iv, data):
+        raise NotImplementedError
+
+    def cbc_decrypt(self, key, iv, data):
+        raise NotImplementedError
+
+    def cbc_decrypt_chunks(self, key, iv, chunks):
+        """Decrypt CBC data given as an iterable of whole-block chunks.
+
+        Yields the plaintext of each chunk as it is decrypted.
+        """
+        for chunk in chunks:
+            yield self.cbc_decrypt(key, iv, chunk)
+            iv = bytes(chunk[-twofish.BLOCK_SIZE:])
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.NAME)
+
+
+class PythonCipherBackend(CipherBackend):
+    """Table-driven Twofish in Python. Uses NumPy for CBC decryption if installed."""
+
+    NAME = "python"
+    PRIORITY = 0
+
+    def ecb_encrypt(self, key, data):
+        return twofish.Twofish(key).encrypt_ecb(data)
+
+    def ecb_decrypt(self, key, data):
+        return twofish.Twofish(key).decrypt_ecb(data)
+
+    def cbc_encrypt(self, key, iv, data):
+        return twofish.Twofish(key).encrypt_cbc(iv, data)
+
+    def cbc_decrypt(self, key, iv, data):
+        return twofish.Twofish(key).decrypt_cbc(iv, data)
+
+
+class GcryptCipherBackend(CipherBackend):
+    """libgcrypt through the cffi bindings of pygcrypt.
+
+    The library is called directly with separate output buffers, since
+    pygcrypt's Cipher works in place, even on bytes objects.
+    """
+
+    NAME = "gcrypt"
+    PRIORITY = 10
+
+    @classmethod
+    def available(cls):
+        try:
+            from pygcrypt.ciphers import lib
+            return lib.gcry_cipher_get_algo_blklen(lib.GCRY_CIPHER_TWOFISH) == 16
+        except Exception:
+            return False
+
+    def __init__(self):
+        from pygcrypt.ciphers import ffi, lib
+
+        self._ffi = ffi
+        self._lib = lib
+
+    def _crypt(self, encrypt, mode, key, iv, data):
+        ffi, lib = self._ffi, self._lib
+        if len(data) % twofish.BLOCK_SIZE:
+            raise ValueError("Data length must be a multiple of %d" % twofish.BLOCK_SIZE)
+        handle = ffi.new("gcry_cipher_hd_t *")
+        self._check(lib.gcry_cipher_open(handle, lib.GCRY_CIPHER_TWOFISH, mode, 0))
+        try:
+            self._check(lib.gcry_cipher_setkey(handle[0], key, len(key)))
+            if iv is not None:
+                self._check(lib.gcry_cipher_setiv(handle[0], iv, len(iv)))
+            out = bytearray(len(data))
+            func = lib.gcry_cipher_encrypt if encrypt else lib.gcry_cipher_decrypt
+            self._check(
+                func(
+                    handle[0],
+                    ffi.from_buffer(out),
+                    len(out),
+                    ffi.from_buffer(data),
+                    len(data),
+                )
+            )
+        finally:
+            lib.gcry_cipher_close(handle[0])
+        return bytes(out)
+
+    def _check(self, error):
+        if error != 0:
+            message = self._ffi.string(self._lib.gcry_strerror(error))
+            raise ValueError("libgcrypt error: %s" % message.decode())
+
+    def ecb_encrypt(self, key, data):
+        return self._crypt(True, self._lib.GCRY_CIPHER_MODE_ECB, key, None, data)
+
+    def ecb_decrypt(self, key, data):
+        return self._crypt(False, self._lib.GCRY_CIPHER_MODE_ECB, key, None, data)
+
+    def cbc_encrypt(self, key, iv, data):
+        return self._crypt(True, self._lib.GCRY_CIPHER_MODE_CBC, key, iv, data)
+
+    def cbc_decrypt(self, key, iv, data):
+        return self._crypt(False, self._lib.GCRY_CIPHER_MODE_CBC, key, iv, data)
+
+
+def get_backend(name=None):
+    """Return a backend instance.
+
+    @param name: Name of the backend. The active backend if not given.
+    @type name: string
+    """
+    return _registry.get(name)
+
+
+def set_backend(name=None):
+    """Select the backend used for all safes. None restores auto-selection."""
+    return _registry.set(name)
+
+
+def available_backends():
+    """Return the names of the backends usable on this host, fastest first."""
+    return _registry.available()
@@ -25,6 +25,25 @@
 DEFAULT_SPECIAL_CHARS = "+-=_@#$%^&;:,.<>/~\\[](){}?!|"
 DEFAULT_EASY_SPECIAL_CHARS = "+-=_@#$%^<>/~\\?"
 
+# Minimum number of key stretch iterations required by the format
+MIN_HASH_ITERATIONS = 2048
+
+# File layout
+PSAFE3_TAG = b"PWS3"
+PSAFE3_EOF = b"PWS3-EOFPWS3-EOF"
+PREAMBLE_SIZE = 152
+TRAILER_SIZE = 48
+
+# Keep the padded raw data of every parsed field, for debugging round trips
+KEEP_RAW_DATA = False
+
+# How hard save() works to get the new file on disk: not at all, fsync the
+# file, or fsync the file and the directory it was renamed in
+DURABILITY_NONE = "none"
+DURABILITY_FILE = "file"
+DURABILITY_DIR = "dir"
+DURABILITY_LEVELS = (DURABILITY_NONE, DURABILITY_FILE, DURABILITY_DIR)
+
 # Configuration options
 
 # Double click and shift double clickactions
@@ -729,3 +748,18 @@ for name, info in list(conf_ints.items()):
     conf_types[name] = int
 for name, info in list(conf_strs.items()):
     conf_types[name] = str
+
+# Index to name mappings, per preference type
+conf_bools_by_index = {info["index"]: name for name, info in conf_bools.items()}
+conf_ints_by_index = {info["index"]: name for name, info in conf_ints.items()}
+conf_strs_by_index = {info["index"]: name for name, info in conf_strs.items()}
+
+# Defaults of the preferences stored in the database
+conf_db_defaults = {}
+for typeS in [conf_bools, conf_ints, conf_strs]:
+    for name, info in typeS.items():
+        if info["type"] == ptDatabase:
+            conf_db_defaults[name] = info["default"]
+
+# Delimiters tried in order for string preferences
+conf_str_delimiters = "\"'#?!%&*+=:;@~<>?,.{}[]()\xbb"
@@ -34,6 +34,14 @@ class InvalidHMACError(PSafeError):
     """Calculated HMAC does not equal HMAC in the file."""
 
 
+class NotASafeError(PSafeError):
+    """File is not a psafe3 file."""
+
+
+class SafeChangedError(PSafeError):
+    """The safe file was changed since it was loaded or saved."""
+
+
 class ROSafe(PSafeError):
     """Safe is not in read/write mode."""
 
@@ -25,15 +25,15 @@
 
 import logging
 import logging.config
-import os
+import re
 import time
 from binascii import unhexlify
 from pprint import pformat
 from struct import pack, unpack
 from uuid import UUID, uuid4
 
-from . import consts, errors
-from .records import makedatetime
+from . import blocks, consts, errors, trace
+from .records import _serial_key_getter, makedatetime
 
 
 # logging.config.fileConfig('/etc/mss/psafe_log.conf')
@@ -51,6 +51,7 @@ class _HeaderType(type):
             # Make sure no type ids are duplicated
             assert cls.TYPE not in headers
             headers[cls.TYPE] = cls
+        cls._serial_key = _serial_key_getter(cls)
 
 
 class Header(metaclass=_HeaderType):
@@ -58,37 +59,46 @@ class Header(metaclass=_HeaderType):
 
     This also serves as an "unknown" header type.
 
-    raw_data    string        Real data that was passed
+    raw_data    string        Real data that was passed. None unless consts.KEEP_RAW_DATA is set.
     data        string        Raw data minus padding and headers
     len        long        Number of bytes of data. May not be present until data has been parsed
-    readblock_f    function    Read in another block of data
+    type        int        Header type as read
     TYPE        int        Header type that IDs it in psafe3
     """
 
     TYPE = None
     FIELD = None
+    # False for headers with lists or dicts that can be changed in place
+    CACHE_SERIAL = True
+    # _serial is (attribute values, serialized data) as of the last save
+    __slots__ = ("type", "len", "data", "raw_data", "_serial")
 
     def __init__(self, htype, hlen, raw_data):
+        self.type = htype
         self.data = raw_data[5:(hlen + 5)]
-        self.raw_data = raw_data
+        self.raw_data = raw_data if consts.KEEP_RAW_DATA else None
         self.len = int(hlen)
         if type(self) != Header:
             assert self.TYPE == htype
-        else:
-            self.TYPE = htype
         self.parse()
 
+    def _type_id(self):
+        """Return the type id, which is only known per instance for unknown headers."""
+        return self.TYPE if self.TYPE is not None else self.type
+
     def parse(self):
         """Parse the header. Should be overridden."""
 
     def gen_blocks(self):
         """Return the raw data that should be stuck in a psafe file."""
+        if self.raw_data is None:
+            return self.serialiaze()
         return self.raw_data
 
     def __repr__(self):
         # Can no longer depend on raw_data existing
         s = self.serial()
-        return "Header(%s,%d,%s)" % (repr(self.TYPE), len(s), repr(s))
+        return "Header(%s,%d,%s)" % (repr(self._type_id()), len(s), repr(s))
 
     def __str__(self):
         return self.__repr__()
@@ -96,39 +106,35 @@ class Header(metaclass=_HeaderType):
     def hmac_data(self):
         """Return the data segments that should be used for the HMAC."""
         # ! See bug 1812081.
-        return self.serial()
+        return self._serial_data()
 
     def serial(self):
         return self.data
 
-    def serialiaze(self):
+    def _serial_data(self):
+        """Return serial() as bytes, reusing it while the attributes are unchanged."""
+        key = self._serial_key(self)
+        cached = getattr(self, "_serial", None)
+        if cached is not None and key is not None and cached[0] == key:
+            return cached[1]
         serial = self.serial()
-        type_ = chr(self.TYPE).encode("iso8859-1")
-        log.debug(
-            "len: %s type: %s final: %s"
-            % (
-                len(serial),
-                repr(type_),
-                repr(pack("=lc", len(serial), type_)),
-            )
-        )
         if isinstance(serial, str):
-            serial = serial.encode("us-ascii")
-        padded = self._pad(pack("=lc", len(serial), type_) + serial)
-        log.debug("Padded data %s" % repr(padded))
-        return padded
-
-    def _pad(self, data):
-        """Pad out data to 16 bytes."""
-        add_data = 16 - len(data) % 16
-        if add_data == 16:
-            add_data = 0
-        padding = b""
-        for i in range(0, add_data):
-            padding += os.urandom(1)
-        assert len(padding) == add_data
-        assert len(data + padding) % 16 == 0
-        return data + padding
+            serial = serial.encode("utf-8")
+        if trace.active:
+            trace.emit("serialize", None, self._type_id(), len(serial), serial)
+        self._serial = (key, serial) if key is not None else None
+        return serial
+
+    def mark_dirty(self):
+        """Drop the cached serialized data after changing an attribute in place."""
+        self._serial = None
+
+    def _field(self):
+        """Return the type id and serialized data, for blocks.pack_fields."""
+        return self._type_id(), self._serial_data()
+
+    def serialiaze(self):
+        return bytes(blocks.pack_fields([self._field()]))
 
 
 class VersionHeader(Header):
@@ -150,6 +156,7 @@ class VersionHeader(Header):
     """
 
     TYPE = 0x00
+    __slots__ = ("version",)
     FIELD = "version"
 
     def __init__(self, htype=None, hlen=2, raw_data=None, version=0x305):
@@ -199,6 +206,7 @@ class UUIDHeader(Header):
     """
 
     TYPE = 0x01
+    __slots__ = ("uuid",)
     FIELD = "uuid"
 
     def __init__(self, htype=None, hlen=16, raw_data=None, uuid=None):
@@ -226,10 +234,91 @@ class UUIDHeader(Header):
         return pack("=16s", self.uuid.bytes)
 
 
+class PrefsDict(dict):
+    """Preferences of a NonDefaultPrefsHeader.
+
+    Remembers the serialized preferences until it is changed.
+        cached_serial    string        Serialized prefs. None if not known.
+    """
+
+    def __init__(self, *args, **kw):
+        dict.__init__(self, *args, **kw)
+        self.cached_serial = None
+
+    def __setitem__(self, key, value):
+        self.cached_serial = None
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.cached_serial = None
+        dict.__delitem__(self, key)
+
+    def __ior__(self, other):
+        self.cached_serial = None
+        return dict.__ior__(self, other)
+
+    def clear(self):
+        self.cached_serial = None
+        dict.clear(self)
+
+    def pop(self, *args):
+        self.cached_serial = None
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.cached_serial = None
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self.cached_serial = None
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kw):
+        self.cached_serial = None
+        dict.update(self, *args, **kw)
+
+
+# A bool or int pref is "B|I index value", a string pref is "S index dVALUEd"
+# where d is any char not in the value
+_PREF_TOKEN = re.compile(rb" *(?:([BI]) (\d+) (\S+)|(S) (\d+) (.)(.*?)\6)", re.DOTALL)
+
+_PREF_NAMES = {
+    b"B": consts.conf_bools_by_index,
+    b"I": consts.conf_ints_by_index,
+    b"S": consts.conf_strs_by_index,
+}
+
+
+def _tokenize_prefs(data):
+    """Yield the (type, name, value) of each pref in data, in one pass."""
+    pos = 0
+    end = len(data.rstrip())
+    while pos < end:
+        match = _PREF_TOKEN.match(data, pos)
+        if match is None:
+            rtype = data[pos:].lstrip()[:1]
+            if rtype in _PREF_NAMES:
+                raise errors.PrefsValueError("Malformed preference at %r" % data[pos:])
+            raise errors.PrefsDataTypeError(
+                "Unexpected record type for preferences %r" % rtype
+            )
+        if match.group(1):
+            rtype, key, value = match.group(1, 2, 3)
+        else:
+            rtype, key, value = match.group(4, 5, 7)
+        name = _PREF_NAMES[rtype].get(int(key))
+        if name is None:
+            raise errors.ConfigItemNotFoundError(
+                "%d is not a valid configuration item" % int(key)
+            )
+        yield rtype, name, value
+        pos = match.end()
+
+
 class NonDefaultPrefsHeader(Header):
     """Version header object
         version         int         Psafe version
-        opts            dict        All config options
+        opts            PrefsDict   All config options
 
     K:V for opts:
 
@@ -240,6 +329,7 @@ class NonDefaultPrefsHeader(Header):
     """
 
     TYPE = 0x02
+    __slots__ = ("_opts",)
     FIELD = "opts"
 
     def __init__(self, htype=None, hlen=2, raw_data=None, **kw):
@@ -250,44 +340,31 @@ class NonDefaultPrefsHeader(Header):
         else:
             self.opts = kw
 
+    @property
+    def opts(self):
+        return self._opts
+
+    @opts.setter
+    def opts(self, value):
+        if not isinstance(value, PrefsDict):
+            value = PrefsDict(value)
+        self._opts = value
+
     def parse(self):
         """Parse data."""
-        self.opts = {}
-        remander = self.data.split(b" ")
-        while len(remander) > 2:
-            # Pull out the data
-            rtype = remander[0]
-            key = int(remander[1])
-            value = remander[2]
-            del remander[0:3]
+        opts = PrefsDict()
+        for rtype, name, value in _tokenize_prefs(self.data):
             if rtype == b"B":
-                found = False
-                for name, info in list(consts.conf_bools.items()):
-                    if info["index"] == key:
-                        found = True
-                        break
-                if not found:
-                    raise errors.ConfigItemNotFoundError(
-                        "%d is not a valid configuration item" % key
-                    )
                 if value == b"0":
-                    self.opts[name] = False
+                    opts[name] = False
                 elif value == b"1":
-                    self.opts[name] = True
+                    opts[name] = True
                 else:
                     raise errors.PrefsValueError(
                         "Expected either 0 or 1 for bool type, got %r" % value
                     )
             elif rtype == b"I":
-                found = False
-                for name, info in list(consts.conf_ints.items()):
-                    if info["index"] == key:
-                        found = True
-                        break
-                if not found:
-                    raise errors.ConfigItemNotFoundError(
-                        "%d is not a valid configuration item" % key
-                    )
+                info = consts.conf_ints[name]
                 try:
                     value = int(value)
                 except ValueError:
@@ -296,37 +373,14 @@ class NonDefaultPrefsHeader(Header):
                     raise errors.PrefsDataTypeError("%r is too small" % value)
                 if info["max"] != -1 and info["max"] < value:
                     raise errors.PrefsDataTypeError("%r is too big" % value)
-                self.opts[name] = value
-            elif rtype == b"S":
-                found = False
-                for name, info in list(consts.conf_strs.items()):
-                    if info["index"] == key:
-                        found = True
-                        break
-                if not found:
-                    raise errors.ConfigItemNotFoundError(
-                        "%d is not a valid configuration item" % key
-                    )
-                # Remove "" or whatever the delimiter is
-                delm = value[0]
-                if value[-1] == delm:
-                    value = value[1:-1]
-                else:
-                    while (delm not in remander[0]) and (len(remander) > 0):
-                        value += remander[0]
-                        del remander[0]
-                    value = value[1:-1]
-                # Save the pref
-                self.opts[name] = value
+                opts[name] = value
             else:
-                raise errors.PrefsDataTypeError(
-                    "Unexpected record type for preferences %r" % rtype
-                )
+                opts[name] = value.decode("utf-8")
         # Fill in defaults prefs
-        for typeS in [consts.conf_bools, consts.conf_ints, consts.conf_strs]:
-            for name, info in list(typeS.items()):
-                if name not in self.opts and info["type"] == consts.ptDatabase:
-                    self.opts[name] = info["default"]
+        for name, default in consts.conf_db_defaults.items():
+            if name not in opts:
+                opts[name] = default
+        self.opts = opts
 
     def __repr__(self):
         return "NonDefaultPrefs" + Header.__repr__(self)
@@ -334,7 +388,19 @@ class NonDefaultPrefsHeader(Header):
     def __str__(self):
         return "NonDefaultPrefs=%s" % pformat(self.opts)
 
+    def _serial_data(self):
+        # opts is changed in place and clears its own cache
+        if self.opts.cached_serial is None:
+            self._serial = None
+        return Header._serial_data(self)
+
     def serial(self):
+        opts = self.opts
+        if opts.cached_serial is None:
+            opts.cached_serial = self._serial_opts()
+        return opts.cached_serial
+
+    def _serial_opts(self):
         ret = ""
         for name, value in list(self.opts.items()):
             if name not in consts.conf_types:
@@ -368,13 +434,9 @@ class NonDefaultPrefsHeader(Header):
                 if value == consts.conf_strs[name]["default"]:
                     # Default value - Don't save
                     continue
-                delms = list("\"'#?!%&*+=:;@~<>?,.{}[]()\xbb")
-                delm = None
-                while delm is None and len(delms) > 0:
-                    if delms[0] not in value:
-                        delm = delms[0]
-                    else:
-                        del delms[0]
+                delm = next(
+                    (d for d in consts.conf_str_delimiters if d not in value), None
+                )
                 if not delm:
                     raise errors.UnableToFindADelimitersError(
                         "Couldn't find a delminator for %r" % value
@@ -394,6 +456,7 @@ class TreeDisplayStatusHeader(Header):
     """Tree display status (what folders are expanded/collapsed)."""
 
     TYPE = 0x03
+    __slots__ = ("status",)
     FIELD = "status"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, status=""):
@@ -427,6 +490,7 @@ class TimeStampOfLastSaveHeader(Header):
     """
 
     TYPE = 0x04
+    __slots__ = ("lastsave",)
     FIELD = "lastsave"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, lastsave=time.gmtime()):
@@ -460,6 +524,7 @@ class WhoLastSavedHeader(Header):
     """User who last saved the DB.     *DEPRECATED*"""
 
     TYPE = 0x05
+    __slots__ = ("username",)
     FIELD = "username"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, username=""):
@@ -493,6 +558,7 @@ class LastSaveAppHeader(Header):
     """
 
     TYPE = 0x06
+    __slots__ = ("lastSaveApp",)
     FIELD = "lastSaveApp"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, lastSaveApp=""):
@@ -526,6 +592,7 @@ class LastSaveUserHeader(Header):
     """
 
     TYPE = 0x07
+    __slots__ = ("username",)
     FIELD = "username"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, username=""):
@@ -559,6 +626,7 @@ class LastSaveHostHeader(Header):
     """
 
     TYPE = 0x08
+    __slots__ = ("hostname",)
     FIELD = "hostname"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, hostname=""):
@@ -589,6 +657,7 @@ class DBNameHeader(Header):
     """
 
     TYPE = 0x09
+    __slots__ = ("dbName",)
     FIELD = "dbName"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, dbName=""):
@@ -668,6 +737,9 @@ class NamedPasswordPoliciesHeader(Header):
     """Named password policies"""
 
     TYPE = 0x10
+    __slots__ = ("namedPasswordPolicies",)
+    # Changed in place, so serialized on every save
+    CACHE_SERIAL = False
     FIELD = "namedPasswordPolicies"
     # A few constants
     USELOWERCASE = 0x8000
@@ -831,6 +903,7 @@ class DBDescHeader(Header):
     """
 
     TYPE = 0x0A
+    __slots__ = ("dbDesc",)
     FIELD = "dbDesc"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, dbDesc=""):
@@ -866,6 +939,7 @@ class DBFiltersHeader(Header):
     """
 
     TYPE = 0x0B
+    __slots__ = ("dbFilter",)
     FIELD = "dbFilter"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, dbFilter=""):
@@ -908,6 +982,9 @@ class RecentEntriesHeader(Header):
     """
 
     TYPE = 0x0F
+    __slots__ = ("recentEntries",)
+    # Changed in place, so serialized on every save
+    CACHE_SERIAL = False
     FIELD = "recentEntries"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, recentEntries=[]):
@@ -960,6 +1037,7 @@ class EmptyGroupHeader(Header):
     """
 
     TYPE = 0x11
+    __slots__ = ("groupName",)
     FIELD = "groupName"
 
     def __init__(self, htype=None, hlen=1, raw_data=None, groupName=""):
@@ -997,7 +1075,7 @@ class EOFHeader(Header):
     """
 
     TYPE = 0xFF
-    data = ""
+    __slots__ = ()
 
     def __init__(self, htype=None, hlen=0, raw_data=""):
         if not htype:
@@ -1005,7 +1083,7 @@ class EOFHeader(Header):
         if raw_data:
             Header.__init__(self, htype, hlen, raw_data)
         else:
-            pass
+            self.data = b""
 
     def __repr__(self):
         return "EOF" + Header.__repr__(self)
@@ -1020,22 +1098,23 @@ def Create_Header(fetchblock_f):
     Uses fetchblock_f to read a 16 byte chunk of data fetchblock_f
     (number of blocks).
     """
+    offset = getattr(fetchblock_f, "offset", None) if trace.active else None
     firstblock = fetchblock_f(1)
-    log.debug("Header of header: %s" % repr(firstblock[:5]))
     (rlen, rtype) = unpack("=lc", firstblock[:5])
     rtype = ord(rtype)
-    data = firstblock[5:]
-    log.debug("Rtype: %s Len: %s" % (rtype, rlen))
-    if rlen > len(data):
-        data += fetchblock_f(((rlen - len(data) - 1) / 16) + 1)
-    assert rlen <= len(data)
-    # TODO: Clean up header add back
-    data = firstblock[:5] + data
+    # Fetch the rest of the field in one go, keeping the type+len header
+    data = firstblock
+    if rlen > len(data) - 5:
+        data += fetchblock_f((rlen - len(data) + 5 - 1) // 16 + 1)
+    assert rlen <= len(data) - 5
     if rtype in headers:
-        return headers[rtype](rtype, rlen, data)
+        header = headers[rtype](rtype, rlen, data)
     else:
         # Unknown header
-        return Header(rtype, rlen, data)
+        header = Header(rtype, rlen, data)
+    if trace.active:
+        trace.emit("header", offset, rtype, rlen, header)
+    return header
 
 
 if __name__ == "__main__":
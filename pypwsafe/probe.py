@@ -0,0 +1,131 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Inspect psafe3 files without a password.
+
+Only the preamble at the start and the trailer at the end of a file are
+read.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from struct import unpack
+
+from . import consts, errors
+
+
+log = logging.getLogger("psafe.lib.probe")
+log.debug("initing")
+
+
+class SafeInfo:
+    """What can be learned about a safe without its password.
+
+    filename         string        Path of the file as given
+    tag              bytes         File tag. Always PWS3.
+    salt             bytes         Salt of the key stretch
+    iterations       int           Key stretch iterations
+    size             int           File size in bytes
+    cryptdata_len    int           Bytes of encrypted headers and records
+    eof              bytes         EOF marker before the HMAC
+    hmac             bytes         HMAC of the headers and records
+    """
+
+    def __init__(self, filename, tag, salt, iterations, size, eof, hmac):
+        self.filename = filename
+        self.tag = tag
+        self.salt = salt
+        self.iterations = iterations
+        self.size = size
+        self.cryptdata_len = size - consts.PREAMBLE_SIZE - consts.TRAILER_SIZE
+        self.eof = eof
+        self.hmac = hmac
+
+    @property
+    def trailer_ok(self):
+        """True if the EOF marker is in place and the ciphertext is whole blocks."""
+        return self.eof == consts.PSAFE3_EOF and self.cryptdata_len % 16 == 0
+
+    def __repr__(self):
+        return "SafeInfo(%r, iterations=%d, size=%d, trailer_ok=%r)" % (
+            self.filename,
+            self.iterations,
+            self.size,
+            self.trailer_ok,
+        )
+
+
+def probe(filename):
+    """Read the preamble and trailer of a safe.
+
+    @param filename: The path to the file.
+    @type filename: string
+    @rtype: SafeInfo
+    @raise NotASafeError: The file is too short or doesn't start with the psafe3 tag.
+    """
+    with open(filename, "rb") as fil:
+        size = os.fstat(fil.fileno()).st_size
+        preamble = fil.read(consts.PREAMBLE_SIZE)
+        too_short = size < consts.PREAMBLE_SIZE + consts.TRAILER_SIZE
+        if too_short or preamble[:4] != consts.PSAFE3_TAG:
+            raise errors.NotASafeError("%s is not a psafe3 file" % filename)
+        fil.seek(size - consts.TRAILER_SIZE)
+        trailer = fil.read(consts.TRAILER_SIZE)
+    (tag, salt, iterations) = unpack("4s32sI", preamble[:40])
+    (eof, hmac) = unpack("16s32s", trailer)
+    return SafeInfo(filename, tag, salt, iterations, size, eof, hmac)
+
+
+def _probe_for_scan(filename):
+    """Probe a file in a worker thread. Errors are returned, not raised."""
+    try:
+        return probe(filename), None
+    except Exception as e:
+        return None, e
+
+
+def scan_dir(path, workers=None, recursive=True):
+    """Probe every file under a directory concurrently.
+
+    Files that aren't psafe3 files are skipped.
+    @param path: The directory to scan.
+    @type path: string
+    @param workers: Number of threads. Defaults to the executor's default.
+    @type workers: int
+    @param recursive: Also scan subdirectories.
+    @type recursive: bool
+    @rtype: ({filename: SafeInfo}, {filename: Exception})
+    @return: The safes found and the errors of files that couldn't be read.
+    """
+    filenames = []
+    for dirpath, dirnames, files in os.walk(path):
+        filenames.extend(os.path.join(dirpath, name) for name in files)
+        if not recursive:
+            break
+    found = {}
+    failed = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for filename, (info, error) in zip(
+            filenames, executor.map(_probe_for_scan, filenames)
+        ):
+            if info is not None:
+                found[filename] = info
+            elif not isinstance(error, errors.NotASafeError):
+                log.info("Failed to probe %r: %r", filename, error)
+                failed[filename] = error
+    return found, failed
@@ -25,49 +25,57 @@ import calendar
 import datetime
 import logging
 import logging.config
-import os
 import time
+from operator import attrgetter
 from struct import pack, unpack
 from uuid import UUID, uuid4
 
-from . import errors
+from . import blocks, consts, errors, trace
 
 
 # logging.config.fileConfig('/etc/mss/psafe_log.conf')
 psafe_logger = logging.getLogger("psafe.lib.record")
-psafe_logger.setLevel(logging.DEBUG)  # FIXME: REMOVE ME
 psafe_logger.debug("initing")
 
 RecordPropTypes = {}
+RecordPropNames = {}
+# Indexed by rTYPE; None for unknown types
+RecordPropTable = [None] * 256
 
 
 class Record:
     """Represents a psafe3 record
     Container item: Name of properity
     Attrs
-    records        [RecordProp]        List of properities
+    records        [RecordProp]        Properities in file order
     lk        {TypeName:RecordProp}
 
+    Each property keeps its serialized data until one of its attributes is
+    set, so only changed fields are serialized again on save.
     """
 
-    def __init__(self, fetchblock_f=None):
-        psafe_logger.debug("Creating record object")
+    def __init__(self, fetchblock_f=None, hmac_obj=None):
+        """
+        @param fetchblock_f: Read the record from this block reader. A blank record is created if not given.
+        @type fetchblock_f: function
+        @param hmac_obj: Fed the data of each field as it is read.
+        @type hmac_obj: hmac.HMAC
+        """
         self.records = []
         self.lk = {}
         if fetchblock_f:
-            psafe_logger.debug("Creating from existing data")
             rcd = Create_Prop(fetchblock_f)
-            psafe_logger.debug("Creating record %s" % repr(rcd))
             self.records.append(rcd)
             self.lk[rcd.rNAME] = rcd
+            if hmac_obj is not None:
+                hmac_obj.update(rcd.data)
             while type(rcd) != EOERecordProp:
                 rcd = Create_Prop(fetchblock_f)
-                psafe_logger.debug("Creating record %s" % repr(rcd))
                 self.records.append(rcd)
                 self.lk[rcd.rNAME] = rcd
-            psafe_logger.debug("Created all records. ")
+                if hmac_obj is not None:
+                    hmac_obj.update(rcd.data)
         else:
-            psafe_logger.debug("Creating blank object")
             # Create the UUID object
             self._if_noitem(UUIDRecordProp.rNAME)
             # Create the EOE object.
@@ -76,7 +84,6 @@ class Record:
             eoe = EOERecordProp()
             self.records.append(eoe)
             self.lk[eoe.rNAME] = eoe
-        psafe_logger.debug("Created record object. ")
 
     def __getitem__(self, key):
         self._if_noitem(key)
@@ -90,11 +97,11 @@ class Record:
     def _if_noitem(self, item):
         """If an item isn't in our key store, create it."""
         if item not in self.lk:
-            for i in list(RecordPropTypes.values()):
-                if i.rNAME == item:
-                    r = i()
-                    self.lk[item] = r
-                    self.records.insert(0, r)
+            cls = RecordPropNames.get(item)
+            if cls is not None:
+                r = cls()
+                self.lk[item] = r
+                self.records.insert(0, r)
 
     def __iter__(self):
         return self.lk.__iter__()
@@ -119,23 +126,28 @@ class Record:
     def hmac_data(self):
         """Returns the data required for the "broken" hmac in psafe3."""
         # ! See bug 1812081.
-        ret = b""
-        for i in self.records:
-            # the data field has the data minus the padding
-            # if i.serial()!=i.data:
-            #    psafe_logger.warn('Serial != data for class %s. s: %s d: %s'%(repr(i.__class__),repr(i.serial()),repr(i.data)))
-            s = i.serial()
-            if isinstance(s, str):
-                s = s.encode("us-ascii")
-            ret += s
-        return ret
+        return b"".join(self._hmac_fields())
+
+    def update_hmac(self, hmac_obj):
+        """Feed the hmac data of each field to hmac_obj."""
+        for s in self._hmac_fields():
+            hmac_obj.update(s)
+
+    def _hmac_fields(self):
+        return (data for _, data in self._fields())
+
+    def _fields(self):
+        """Return the (type, data) of each field, for blocks.pack_fields."""
+        return [r._field() for r in self.records]
+
+    def mark_dirty(self):
+        """Serialize every field again on the next save."""
+        for r in self.records:
+            r.mark_dirty()
 
     def serialiaze(self):
         """ """
-        ret = b""
-        for r in self.records:
-            ret += r.serialiaze()
-        return ret
+        return bytes(blocks.pack_fields(self._fields()))
 
     # Accessor methods
     def getGroup(self):
@@ -270,8 +282,7 @@ class Record:
         history.maxsize = len(history.history)
 
     def setHistory(self, history):
-        history = self._find_hist()
-        history.set(history)
+        self["PasswordHistory"] = history
 
     def getRunCommand(self):
         return self["RunCommand"]
@@ -404,61 +415,169 @@ class Record:
         return ret
 
 
+class LazyRecord(Record):
+    """A record whose properties are parsed on first access.
+
+    Reading only keeps the raw data of the record and the (offset, type,
+    length) span of each field in it. A property is created the first time
+    it is looked up by name; anything that needs the whole record, such as
+    setting a value or iterating, creates all of them.
+    """
+
+    def __init__(self, fetchblock_f, hmac_obj=None):
+        """
+        @param fetchblock_f: Read the record from this block reader.
+        @type fetchblock_f: function
+        @param hmac_obj: Fed the data of each field as it is read.
+        @type hmac_obj: hmac.HMAC
+        """
+        self._data, self._spans = index_record(fetchblock_f, hmac_obj)
+        self._props = {}
+        self._records = None
+        self._lk = None
+
+    def _prop(self, index):
+        """Return the property of the field at index, creating it if needed."""
+        prop = self._props.get(index)
+        if prop is None:
+            offset, rtype, rlen = self._spans[index]
+            raw = self._data[offset:offset + blocks.padded_len(rlen)]
+            prop = _make_prop(rtype, rlen, raw)
+            self._props[index] = prop
+        return prop
+
+    def _materialize(self):
+        if self._records is None:
+            records = []
+            lk = {}
+            for index in range(len(self._spans)):
+                prop = self._prop(index)
+                records.append(prop)
+                lk[prop.rNAME] = prop
+            self._records = records
+            self._lk = lk
+            self._data = self._spans = self._props = None
+
+    @property
+    def records(self):
+        self._materialize()
+        return self._records
+
+    @property
+    def lk(self):
+        self._materialize()
+        return self._lk
+
+    def __getitem__(self, key):
+        cls = RecordPropNames.get(key)
+        if self._records is None and cls is not None:
+            # The last field of a type wins, as in Record
+            for index in range(len(self._spans) - 1, -1, -1):
+                if self._spans[index][1] == cls.rTYPE:
+                    prop = self._prop(index)
+                    if prop.rNAME == key:
+                        return prop.get()
+                    break
+        return Record.__getitem__(self, key)
+
+    def __len__(self):
+        if self._records is None:
+            return len(self._spans)
+        return len(self._records)
+
+    def _hmac_fields(self):
+        if self._records is not None:
+            return Record._hmac_fields(self)
+        # Untouched fields hash the data they were read with
+        return (
+            self._data[offset + 5:offset + 5 + rlen]
+            for offset, _, rlen in self._spans
+        )
+
+    def _fields(self):
+        if self._records is not None:
+            return Record._fields(self)
+        # Untouched fields are written as they were read
+        return (
+            (rtype, self._data[offset + 5:offset + 5 + rlen])
+            for offset, rtype, rlen in self._spans
+        )
+
+
+# Slots that serial() doesn't read
+_UNKEYED_SLOTS = frozenset(("type", "len", "raw_data", "_serial"))
+
+
+def _serial_key_getter(cls):
+    """Return a function giving the attribute values that serial() reads.
+
+    The serialized data of an object is reused while these compare equal.
+    The function returns None if it can't be reused, because cls has lists
+    or dicts that can be changed in place or an attribute is not set.
+    """
+    names = [
+        name
+        for c in reversed(cls.__mro__)
+        for name in c.__dict__.get("__slots__", ())
+        if name not in _UNKEYED_SLOTS
+    ]
+    if not cls.CACHE_SERIAL or not names:
+        return staticmethod(lambda obj: None)
+    getter = attrgetter(*names)
+
+    def key(obj):
+        try:
+            return getter(obj)
+        except AttributeError:
+            return None
+
+    return staticmethod(key)
+
+
 class _RecordPropType(type):
     def __init__(cls, name, bases, dct):
         super().__init__(name, bases, dct)
         # Skip any where rType is none, such as the base class
         if cls.rTYPE:
             RecordPropTypes[cls.rTYPE] = cls
+            RecordPropNames[cls.rNAME] = cls
+            RecordPropTable[cls.rTYPE] = cls
+        cls._serial_key = _serial_key_getter(cls)
 
 
 class RecordProp(metaclass=_RecordPropType):
     """A single property of a psafe3 record.
 
     This represents an unknown type or is overridden by records of a known type.
+    Properties use __slots__, so subclasses must list the attributes they set.
 
     rTYPE        int        Properity type. May be null.
     rNAME        string        Code name of properity type.
     type        int        Prop type.
     len        int        Length, in bytes, of data
-    raw_data    string        Record data including padding and headers
+    raw_data    string        Record data including padding and headers. None unless consts.KEEP_RAW_DATA is set.
     data        string        Record data minus headers and padding
     """
 
     rTYPE = None
     rNAME = "Unknown"
+    # False for props with lists or dicts that can be changed in place
+    CACHE_SERIAL = True
+    # _serial is (attribute values, serialized data) as of the last save
+    __slots__ = ("type", "len", "data", "raw_data", "_serial")
 
     def __init__(self, ptype, plen, pdata):
         self.type = ptype
         if self.rTYPE:
             assert self.rTYPE == ptype
-        else:
-            self.rTYPE = ptype
         self.len = plen
-        self.raw_data = pdata
+        self.raw_data = pdata if consts.KEEP_RAW_DATA else None
         self.data = pdata[5:(plen + 5)]
-        psafe_logger.debug(
-            "Created psafe record prop with rTYPE of %s. Class %s",
-            repr(self.rTYPE),
-            repr(self.__class__),
-        )
         self.parse()
-        if self.rNAME == "Unknown":
-            psafe_logger.debug(
-                "Created psafe record prop of unknown type. rType: %s rLen: %s Data: %s Raw: %s",
-                repr(ptype),
-                repr(plen),
-                repr(self.data),
-                repr(self.raw_data),
-            )
-        else:
-            psafe_logger.debug(
-                "Created psafe record prop of known type. rType: %s rLen: %s Data: %s Raw: %s",
-                repr(ptype),
-                repr(plen),
-                repr(self.data),
-                repr(self.raw_data),
-            )
+
+    def _type_id(self):
+        """Return the type id, which is only known per instance for unknown props."""
+        return self.rTYPE if self.rTYPE is not None else self.type
 
     def parse(self):
         """Override me. Called on init to parse received data."""
@@ -477,38 +596,33 @@ class RecordProp(metaclass=_RecordPropType):
     def set(self, value):
         self.data = value
 
-    def _rand_char(self):
-        """Returns a random char"""
-        return os.urandom(1)
-
-    def _pad(self, data):
-        """Pad out data to 16 bytes"""
-        add_data = 16 - len(data) % 16
-        if add_data == 16:
-            add_data = 0
-        padding = b""
-        for i in range(0, add_data):
-            padding += self._rand_char()
-        assert add_data != 16
-        assert len(padding) == add_data
-        assert len(data + padding) % 16 == 0
-        return data + padding
-
     def serial(self):
         """Returns the raw data blocks to generate this object
         EXCLUDING TYPE+LEN!"""
         # psafe_logger.debug('Serial to %s',repr(self.data))
         return self.data
 
-    def serialiaze(self):
-        """Returns the raw data blocks to generate this object."""
+    def _field(self):
+        """Return the type id and serialized data, for blocks.pack_fields."""
+        key = self._serial_key(self)
+        cached = getattr(self, "_serial", None)
+        if cached is not None and key is not None and cached[0] == key:
+            return self._type_id(), cached[1]
         serial = self.serial()
-        header = pack("=lc", len(serial), chr(self.rTYPE).encode("iso8859-1"))
         if isinstance(serial, str):
             serial = serial.encode("us-ascii")
-        padded = self._pad(header + serial)
-        psafe_logger.debug("Padded output %s" % repr(padded))
-        return padded
+        if trace.active:
+            trace.emit("serialize", None, self._type_id(), len(serial), serial)
+        self._serial = (key, serial) if key is not None else None
+        return self._type_id(), serial
+
+    def mark_dirty(self):
+        """Drop the cached serialized data after changing an attribute in place."""
+        self._serial = None
+
+    def serialiaze(self):
+        """Returns the raw data blocks to generate this object."""
+        return bytes(blocks.pack_fields([self._field()]))
 
 
 class UUIDRecordProp(RecordProp):
@@ -525,6 +639,7 @@ class UUIDRecordProp(RecordProp):
 
     rTYPE = 0x01
     rNAME = "UUID"
+    __slots__ = ("uuid",)
 
     def __init__(self, ptype=None, plen=16, pdata=None):
         if not ptype:
@@ -576,6 +691,9 @@ class GroupRecordProp(RecordProp):
 
     rTYPE = 0x02
     rNAME = "Group"
+    __slots__ = ("group", "group_str")
+    # Changed in place, so serialized on every save
+    CACHE_SERIAL = False
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -625,6 +743,7 @@ class TitleRecordProp(RecordProp):
 
     rTYPE = 0x03
     rNAME = "Title"
+    __slots__ = ("title",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -672,6 +791,7 @@ class UsernameRecordProp(RecordProp):
 
     rTYPE = 0x04
     rNAME = "Username"
+    __slots__ = ("username",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -720,6 +840,7 @@ class NotesRecordProp(RecordProp):
 
     rTYPE = 0x05
     rNAME = "Notes"
+    __slots__ = ("notes",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -766,6 +887,7 @@ class PasswordRecordProp(RecordProp):
 
     rTYPE = 0x06
     rNAME = "Password"
+    __slots__ = ("password",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -814,6 +936,7 @@ class CreationTimeRecordProp(RecordProp):
 
     rTYPE = 0x07
     rNAME = "ctime"
+    __slots__ = ("dt",)
 
     def __init__(self, ptype=None, plen=4, pdata=None):
         if not ptype:
@@ -860,6 +983,7 @@ class ModTimeRecordProp(RecordProp):
 
     rTYPE = 0x08
     rNAME = "mtime"
+    __slots__ = ("dt",)
 
     def __init__(self, ptype=None, plen=4, pdata=None):
         if not ptype:
@@ -908,6 +1032,7 @@ class LastAccessTimeRecordProp(RecordProp):
 
     rTYPE = 0x09
     rNAME = "LastAccess"
+    __slots__ = ("dt",)
 
     def __init__(self, ptype=None, plen=4, pdata=None):
         if not ptype:
@@ -954,6 +1079,7 @@ class PasswordExpiryTimeRecordProp(RecordProp):
 
     rTYPE = 0x0A
     rNAME = "PasswordExpiry"
+    __slots__ = ("dt",)
 
     def __init__(self, ptype=None, plen=4, pdata=None):
         if not ptype:
@@ -1001,6 +1127,7 @@ class LastModificationTimeRecordProp(RecordProp):
 
     rTYPE = 0x0C
     rNAME = "LastModification"
+    __slots__ = ("dt",)
 
     def __init__(self, ptype=None, plen=4, pdata=None):
         if not ptype:
@@ -1047,6 +1174,7 @@ class URLRecordProp(RecordProp):
 
     rTYPE = 0x0D
     rNAME = "URL"
+    __slots__ = ("url",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -1094,6 +1222,7 @@ class AutotypeRecordProp(RecordProp):
 
     rTYPE = 0x0E
     rNAME = "Autotype"
+    __slots__ = ("autotype",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -1163,8 +1292,9 @@ class PasswordHistoryRecordProp(RecordProp):
 
     rTYPE = 0x0F
     rNAME = "PasswordHistory"
-
-    history = []
+    __slots__ = ("enabled", "maxsize", "history", "zerohack", "_cursize")
+    # Changed in place, so serialized on every save
+    CACHE_SERIAL = False
 
     def __init__(self, ptype=None, plen=0, pdata=None, enabled=0, maxsize=255):
         if not ptype:
@@ -1174,6 +1304,7 @@ class PasswordHistoryRecordProp(RecordProp):
             self.enabled = enabled
             self.maxsize = maxsize
             self.history = []
+            self.zerohack = False
         else:
             RecordProp.__init__(self, ptype, plen, pdata)
 
@@ -1185,12 +1316,10 @@ class PasswordHistoryRecordProp(RecordProp):
             ret += "0"
         ret += "%02x" % self.maxsize
         ret += "%02x" % len(self.history)
-        psafe_logger.debug("Pre-passwords %s" % repr(ret))
         for tm, passwd in self.history:
             ret += "%08x" % calendar.timegm(tm)
             ret += "%04x" % len(passwd)
             ret += passwd
-            psafe_logger.debug("Post-add password %s" % repr(ret))
         if len(self.history) == 0 and self.zerohack:
             ret += "00"
         # psafe_logger.debug("Serial to %s data %s"%(repr(ret),repr(self.data)))
@@ -1211,7 +1340,7 @@ class PasswordHistoryRecordProp(RecordProp):
                 raise errors.PropParsingError(
                     "Invalid enabled/disabled flag %s" % repr(self.data[0])
                 )
-            psafe_logger.debug("Set password history to %s", repr(self.enabled))
+            psafe_logger.debug("Set password history to %r", self.enabled)
             # Max size of hist list
             try:
                 self.maxsize = int(self.data[1:3], 16)
@@ -1325,6 +1454,21 @@ class PasswordPolicyRecordProp(RecordProp):
 
     rTYPE = 0x10
     rNAME = "PasswordPolicy"
+    __slots__ = (
+        "ttllen",
+        "minlow",
+        "minup",
+        "mindig",
+        "minsym",
+        "uselowercase",
+        "useuppercase",
+        "usedigits",
+        "usesymbols",
+        "usehex",
+        "useeasy",
+        "makepron",
+        "mydata",
+    )
     # A few constants
     USELOWERCASE = 0x8000
     USEUPPERCASE = 0x4000
@@ -1433,7 +1577,7 @@ class PasswordPolicyRecordProp(RecordProp):
             self.makepron = True
         else:
             self.makepron = False
-        psafe_logger.debug(str(self))
+        psafe_logger.debug("%s", self)
 
     def __repr__(self):
         return self.rNAME + RecordProp.__repr__(self)
@@ -1508,6 +1652,7 @@ class PasswordExpiryIntervalRecordProp(RecordProp):
 
     rTYPE = 0x11
     rNAME = "PasswordExpiryInterval"
+    __slots__ = ("ttl", "mydata")
 
     def __init__(self, ptype=None, plen=4, pdata=None, ttl=0):
         if not ptype:
@@ -1548,6 +1693,7 @@ class RunCommandRecordProp(RecordProp):
 
     rTYPE = 0x12
     rNAME = "RunCommand"
+    __slots__ = ("runCommand",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -1598,6 +1744,7 @@ class DoubleClickActionRecordProp(RecordProp):
 
     rTYPE = 0x13
     rNAME = "DoubleClickAction"
+    __slots__ = ("action", "mydata")
 
     COPYPASSWORD = 0x00
     VIEWEDIT = 0x01
@@ -1649,6 +1796,7 @@ class EmailAddressRecordProp(RecordProp):
 
     rTYPE = 0x14
     rNAME = "EmailAddress"
+    __slots__ = ("emailAddress",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -1693,6 +1841,7 @@ class ProtectedEntryRecordProp(RecordProp):
 
     rTYPE = 0x15
     rNAME = "ProtectedEntry"
+    __slots__ = ("isProtected", "mydata")
 
     def __init__(self, ptype=None, plen=4, pdata=None, isProtected=False):
         if not ptype:
@@ -1721,9 +1870,6 @@ class ProtectedEntryRecordProp(RecordProp):
 
     def serial(self):
         ret = str(self.isProtected)
-        psafe_logger.debug(
-            "Serial to %s data %s for %r" % (repr(ret), repr(self.data), self.__class__)
-        )
         return ret
 
 
@@ -1739,6 +1885,7 @@ class SymbolsForPasswordRecordProp(RecordProp):
 
     rTYPE = 0x16
     rNAME = "SymbolsForPassword"
+    __slots__ = ("symbols",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -1787,6 +1934,7 @@ class ShiftDoubleClickActionRecordProp(RecordProp):
 
     rTYPE = 0x17
     rNAME = "ShiftDoubleClickAction"
+    __slots__ = ("action", "mydata")
 
     COPYPASSWORD = 0x00
     VIEWEDIT = 0x01
@@ -1841,6 +1989,7 @@ class PasswordPolicyNameRecordProp(RecordProp):
 
     rTYPE = 0x18
     rNAME = "PasswordPolicyName"
+    __slots__ = ("symbols",)
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -1887,6 +2036,7 @@ class EOERecordProp(RecordProp):
 
     rTYPE = 0xFF
     rNAME = "EOE"
+    __slots__ = ()
 
     def __init__(self, ptype=None, plen=0, pdata=None):
         if not ptype:
@@ -1928,28 +2078,63 @@ def Create_Prop(fetchblock_f):
     Uses fetchblock_f to read a 16 byte chunk of data fetchblock_f
     (number of blocks)
     """
-    psafe_logger.debug("Create_Prop")
+    offset = getattr(fetchblock_f, "offset", None) if trace.active else None
+    rTYPE, rlen, data = _fetch_field(fetchblock_f)
+    prop = _make_prop(rTYPE, rlen, data)
+    if trace.active:
+        trace.emit("field", offset, rTYPE, rlen, prop)
+    return prop
+
+
+def index_record(fetchblock_f, hmac_obj=None):
+    """Read the fields of one record without parsing them.
+
+    Returns the raw data of the record and the (offset, type, length) span
+    of each field in it.
+    """
+    parts = []
+    spans = []
+    offset = 0
+    rTYPE = None
+    while rTYPE != EOERecordProp.rTYPE:
+        if trace.active:
+            start = getattr(fetchblock_f, "offset", None)
+        rTYPE, rlen, data = _fetch_field(fetchblock_f)
+        if trace.active:
+            trace.emit("field", start, rTYPE, rlen)
+        spans.append((offset, rTYPE, rlen))
+        if hmac_obj is not None:
+            hmac_obj.update(data[5:rlen + 5])
+        parts.append(data)
+        offset += len(data)
+    return b"".join(parts), spans
+
+
+def _fetch_field(fetchblock_f):
+    """Return the type, length and raw blocks of the next field."""
     firstblock = fetchblock_f(1)
     (rlen, rTYPE) = unpack("=lc", firstblock[:5])
     rTYPE = ord(rTYPE)
-    psafe_logger.debug("rtype %s rlen %s" % (rTYPE, rlen))
-    data = firstblock[5:]
-    if rlen > len(data):
-        data += fetchblock_f(((rlen - len(data) - 1) / 16) + 1)
-    assert rlen <= len(data)
-    # print "Creating records with %s"%repr((rTYPE,rlen,data,len(data)))
-    # Lazy way to add the header data back
-    # TODO: Clean up header add back
-    data = firstblock[:5] + data
-    if rTYPE in RecordPropTypes:
+    # Fetch the rest of the field in one go, keeping the type+len header
+    data = firstblock
+    if rlen > len(data) - 5:
+        data += fetchblock_f((rlen - len(data) + 5 - 1) // 16 + 1)
+    assert rlen <= len(data) - 5
+    return rTYPE, rlen, data
+
+
+def _make_prop(rTYPE, rlen, data):
+    cls = RecordPropTable[rTYPE]
+    if cls is not None:
         try:
-            return RecordPropTypes[rTYPE](rTYPE, rlen, data)
-        except Exception:
+            return cls(rTYPE, rlen, data)
+        except Exception as e:
             psafe_logger.exception("Failed to create record prop")
+            if trace.active:
+                trace.emit("prop_error", None, rTYPE, rlen, e)
             return RecordProp(rTYPE, rlen, data)
     else:
         # Unknown header
-        psafe_logger.debug("Unknown header type %s" % repr(rTYPE))
         return RecordProp(rTYPE, rlen, data)
 
 
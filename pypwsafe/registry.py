@@ -0,0 +1,86 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Registries of interchangeable implementations.
+
+A base class with RegisteredType as its metaclass names a Registry in its
+REGISTRY attribute, and every subclass with a NAME is added to it. The
+available implementation with the highest PRIORITY is used unless one is
+selected by name.
+"""
+
+import logging
+
+
+log = logging.getLogger("psafe.lib.registry")
+log.debug("initing")
+
+
+class RegisteredType(type):
+    def __init__(cls, name, bases, dct):
+        super().__init__(name, bases, dct)
+        # Skip any where NAME is none, such as the base class
+        if cls.NAME:
+            cls.REGISTRY.register(cls)
+
+
+class Registry:
+    """Implementations of one interface, keyed by NAME.
+
+    kind        string        What the implementations are, for messages
+    classes     dict          {NAME: class}
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.classes = {}
+        self._active = None
+
+    def register(self, cls):
+        # Make sure no names are duplicated
+        assert cls.NAME not in self.classes
+        self.classes[cls.NAME] = cls
+
+    def get(self, name=None):
+        """Return an instance of the named implementation, or the active one."""
+        if name is not None:
+            if name not in self.classes:
+                raise ValueError("Unknown %s %r" % (self.kind, name))
+            if not self.classes[name].available():
+                raise ValueError("%s %r is not available" % (self.kind.capitalize(), name))
+            return self.classes[name]()
+        if self._active is None:
+            best = max(
+                (cls for cls in self.classes.values() if cls.available()),
+                key=lambda cls: cls.PRIORITY,
+            )
+            self._active = best()
+            log.debug("Selected %s %r", self.kind, self._active)
+        return self._active
+
+    def set(self, name=None):
+        """Select the active implementation. None restores auto-selection."""
+        self._active = None
+        if name is not None:
+            self._active = self.get(name)
+        return self._active
+
+    def available(self):
+        """Return the names of the implementations usable on this host, fastest first."""
+        usable = [cls for cls in self.classes.values() if cls.available()]
+        usable.sort(key=lambda cls: cls.PRIORITY, reverse=True)
+        return [cls.NAME for cls in usable]
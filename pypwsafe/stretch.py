@@ -0,0 +1,178 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Key stretching engines.
+
+The psafe3 key stretch is H(H(...H(pass+salt)...)), repeated ITER times.
+Engines register themselves by NAME; the available engine with the highest
+PRIORITY is used unless one is selected with set_engine.
+"""
+
+import logging
+import os
+import time
+from hashlib import sha256
+
+from . import consts
+from .registry import RegisteredType, Registry
+
+
+log = logging.getLogger("psafe.lib.stretch")
+log.debug("initing")
+
+_registry = Registry("key stretching engine")
+engines = _registry.classes
+
+# ITER is stored as an unsigned 32 bit int
+MAX_HASH_ITERATIONS = 2**32 - 1
+
+
+class StretchEngine(metaclass=RegisteredType):
+    """A key stretching backend. Should be extended.
+
+    NAME        string        Name used to select the engine
+    PRIORITY    int           Engines with higher values are preferred
+    """
+
+    REGISTRY = _registry
+    NAME = None
+    PRIORITY = 0
+
+    @classmethod
+    def available(cls):
+        """Return True if the engine can be used on this host."""
+        return True
+
+    def stretch(self, passwd, salt, count):
+        """Return the stretched key for passwd and salt."""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.NAME)
+
+
+class PythonStretchEngine(StretchEngine):
+    """Reference implementation using hashlib."""
+
+    NAME = "python"
+    PRIORITY = 0
+
+    def stretch(self, passwd, salt, count):
+        # Hash once with both
+        inithsh = sha256()
+        inithsh.update(passwd)
+        inithsh.update(salt)
+        # Expecting it in binary form; NOT HEX FORM
+        hsh = inithsh.digest()
+        # Rehash
+        for i in range(count):
+            hsh = sha256(hsh).digest()
+        return hsh
+
+
+class GcryptStretchEngine(StretchEngine):
+    """Rehash loop using libgcrypt through pygcrypt.
+
+    Two fixed digest buffers are hashed into each other, so no Python
+    objects are created per round.
+    """
+
+    NAME = "gcrypt"
+    PRIORITY = 10
+
+    @classmethod
+    def available(cls):
+        try:
+            from pygcrypt.hashcontext import lib
+            return lib.gcry_md_get_algo_dlen(lib.GCRY_MD_SHA256) == 32
+        except Exception:
+            return False
+
+    def __init__(self):
+        from pygcrypt.hashcontext import ffi, lib
+
+        self._ffi = ffi
+        self._lib = lib
+
+    def stretch(self, passwd, salt, count):
+        ffi = self._ffi
+        hash_buffer = self._lib.gcry_md_hash_buffer
+        algo = self._lib.GCRY_MD_SHA256
+        first = ffi.new("unsigned char[32]", sha256(passwd + salt).digest())
+        second = ffi.new("unsigned char[32]")
+        for i in range(count // 2):
+            hash_buffer(algo, second, first, 32)
+            hash_buffer(algo, first, second, 32)
+        if count % 2:
+            hash_buffer(algo, second, first, 32)
+            first = second
+        return ffi.buffer(first)[:]
+
+
+def get_engine(name=None):
+    """Return an engine instance.
+
+    @param name: Name of the engine. The active engine if not given.
+    @type name: string
+    """
+    return _registry.get(name)
+
+
+def set_engine(name=None):
+    """Select the engine used by stretchkey. None restores auto-selection."""
+    return _registry.set(name)
+
+
+def available_engines():
+    """Return the names of the engines usable on this host, fastest first."""
+    return _registry.available()
+
+
+def calibrate_iterations(target_ms, engine=None, min_sample_ms=50):
+    """Return the iteration count that takes about target_ms to stretch.
+
+    The engine is timed on this machine with growing iteration counts until
+    a run takes at least min_sample_ms, and the measured rate is scaled to
+    the target. The result is never below the format minimum.
+    @param target_ms: Desired key stretch time in milliseconds.
+    @type target_ms: float
+    @param engine: Name of the engine to time. The active engine if not given.
+    @type engine: string
+    """
+    if target_ms <= 0:
+        raise ValueError("Target time must be positive")
+    stretcher = get_engine(engine)
+    passwd = os.urandom(16)
+    salt = os.urandom(32)
+    count = consts.MIN_HASH_ITERATIONS
+    while True:
+        start = time.perf_counter()
+        stretcher.stretch(passwd, salt, count)
+        elapsed = time.perf_counter() - start
+        if elapsed * 1000 >= min_sample_ms or count >= MAX_HASH_ITERATIONS:
+            break
+        count = min(count * 2, MAX_HASH_ITERATIONS)
+    iterations = int(count * target_ms / (elapsed * 1000))
+    log.debug(
+        "%r: %d iterations in %.1f ms; %d for %.1f ms",
+        stretcher,
+        count,
+        elapsed * 1000,
+        iterations,
+        target_ms,
+    )
+    return max(consts.MIN_HASH_ITERATIONS, min(iterations, MAX_HASH_ITERATIONS))
@@ -0,0 +1,95 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Structured tracing of the fields that are read and written.
+
+The parser and serializer only check the module level active flag per
+field, so nothing is built for a field unless tracing is on. Events go to
+the hook set with set_hook and, if set_field_logging is on, to the
+"psafe.lib.trace" logger at DEBUG.
+"""
+
+import logging
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+log = logging.getLogger("psafe.lib.trace")
+log.debug("initing")
+
+# Checked on every field; True if there is a hook or field logging is on
+active = False
+
+_hook = None
+_log_fields = False
+
+
+class TraceEvent(namedtuple("TraceEvent", "event offset type length value")):
+    """A traced field.
+
+    event        string        "header", "field", "prop_error" or "serialize"
+    offset        int        Offset of the field in the decrypted data. None if not known.
+    type        int        Field type id
+    length        int        Length of the field data
+    value        object        Created object, error or serialized data. May be None.
+    """
+
+    __slots__ = ()
+
+
+def _update():
+    global active
+    active = _hook is not None or _log_fields
+
+
+def set_hook(hook):
+    """Call hook with a TraceEvent for every field. None removes the hook.
+
+    Returns the previous hook.
+    """
+    global _hook
+    previous = _hook
+    _hook = hook
+    _update()
+    return previous
+
+
+def set_field_logging(enabled=True):
+    """Log every traced field to the "psafe.lib.trace" logger."""
+    global _log_fields
+    _log_fields = bool(enabled)
+    _update()
+
+
+def emit(event, offset, type_, length, value=None):
+    """Report a field. Only call when active is True."""
+    ev = TraceEvent(event, offset, type_, length, value)
+    if _log_fields:
+        log.debug("%s at %s: type %#04x len %d %r", event, offset, type_, length, value)
+    if _hook is not None:
+        _hook(ev)
+
+
+@contextmanager
+def collect():
+    """Collect the TraceEvents of the fields handled in the block in a list."""
+    events = []
+    previous = set_hook(events.append)
+    try:
+        yield events
+    finally:
+        set_hook(previous)
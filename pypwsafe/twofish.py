@@ -0,0 +1,341 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Pure-Python Twofish.
+
+The key dependent S-boxes are folded with the MDS matrix into four 256-entry
+tables, so the g function is four lookups and three XORs. Functions work on
+whole buffers of 16-byte blocks. CBC decryption has no dependency between
+blocks and is vectorized with NumPy when it is installed.
+"""
+
+import logging
+import struct
+
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+log = logging.getLogger("psafe.lib.twofish")
+log.debug("initing")
+
+BLOCK_SIZE = 16
+
+_MASK = 0xFFFFFFFF
+
+# Nibble permutations for building q0 and q1
+_Q0_T = (
+    (0x8, 0x1, 0x7, 0xD, 0x6, 0xF, 0x3, 0x2, 0x0, 0xB, 0x5, 0x9, 0xE, 0xC, 0xA, 0x4),
+    (0xE, 0xC, 0xB, 0x8, 0x1, 0x2, 0x3, 0x5, 0xF, 0x4, 0xA, 0x6, 0x7, 0x0, 0x9, 0xD),
+    (0xB, 0xA, 0x5, 0xE, 0x6, 0xD, 0x9, 0x0, 0xC, 0x8, 0xF, 0x3, 0x2, 0x4, 0x7, 0x1),
+    (0xD, 0x7, 0xF, 0x4, 0x1, 0x2, 0x6, 0xE, 0x9, 0xB, 0x3, 0x0, 0x8, 0x5, 0xC, 0xA),
+)
+_Q1_T = (
+    (0x2, 0x8, 0xB, 0xD, 0xF, 0x7, 0x6, 0xE, 0x3, 0x1, 0x9, 0x4, 0x0, 0xA, 0xC, 0x5),
+    (0x1, 0xE, 0x2, 0xB, 0x4, 0xC, 0x3, 0x7, 0x6, 0xD, 0xA, 0x5, 0xF, 0x9, 0x0, 0x8),
+    (0x4, 0xC, 0x7, 0x5, 0x1, 0x6, 0x9, 0xA, 0x0, 0xE, 0xD, 0x8, 0x2, 0xB, 0x3, 0xF),
+    (0xB, 0x9, 0x5, 0x1, 0xC, 0x3, 0xD, 0xE, 0x6, 0x4, 0x7, 0xF, 0x2, 0x0, 0x8, 0xA),
+)
+
+_MDS = (
+    (0x01, 0xEF, 0x5B, 0x5B),
+    (0x5B, 0xEF, 0xEF, 0x01),
+    (0xEF, 0x5B, 0x01, 0xEF),
+    (0xEF, 0x01, 0xEF, 0x5B),
+)
+_MDS_POLY = 0x169
+
+_RS = (
+    (0x01, 0xA4, 0x55, 0x87, 0x5A, 0x58, 0xDB, 0x9E),
+    (0xA4, 0x56, 0x82, 0xF3, 0x1E, 0xC6, 0x68, 0xE5),
+    (0x02, 0xA1, 0xFC, 0xC1, 0x47, 0xAE, 0x3D, 0x19),
+    (0xA4, 0x55, 0x87, 0x5A, 0x58, 0xDB, 0x9E, 0x03),
+)
+_RS_POLY = 0x14D
+
+
+def _build_q(t):
+    def ror4(x, n):
+        return ((x >> n) | (x << (4 - n))) & 0xF
+
+    q = []
+    for x in range(256):
+        a, b = x >> 4, x & 0xF
+        a, b = a ^ b, (a ^ ror4(b, 1) ^ (a << 3)) & 0xF
+        a, b = t[0][a], t[1][b]
+        a, b = a ^ b, (a ^ ror4(b, 1) ^ (a << 3)) & 0xF
+        a, b = t[2][a], t[3][b]
+        q.append((b << 4) | a)
+    return bytes(q)
+
+
+_Q0 = _build_q(_Q0_T)
+_Q1 = _build_q(_Q1_T)
+
+# The q permutations applied to each byte position, outermost first
+_Q_CHAIN = (
+    (_Q1, _Q0, _Q0, _Q1, _Q1),
+    (_Q0, _Q0, _Q1, _Q1, _Q0),
+    (_Q1, _Q1, _Q0, _Q0, _Q0),
+    (_Q0, _Q1, _Q1, _Q0, _Q1),
+)
+
+
+def _gf_mul(a, b, poly):
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        a <<= 1
+        if a & 0x100:
+            a ^= poly
+        b >>= 1
+    return result
+
+
+def _sbox(j, x, key_bytes):
+    """Apply the key dependent S-box of byte position j to x.
+
+    key_bytes holds byte j of each key word, L0 first.
+    """
+    chain = _Q_CHAIN[j]
+    y = x
+    for depth in range(len(key_bytes) - 1, -1, -1):
+        y = chain[depth + 1][y] ^ key_bytes[depth]
+    return chain[0][y]
+
+
+def _mds_column(j, y):
+    result = 0
+    for i in range(4):
+        result |= _gf_mul(_MDS[i][j], y, _MDS_POLY) << (8 * i)
+    return result
+
+
+def _h(x, words):
+    result = 0
+    for j in range(4):
+        key_bytes = [(w >> (8 * j)) & 0xFF for w in words]
+        result ^= _mds_column(j, _sbox(j, (x >> (8 * j)) & 0xFF, key_bytes))
+    return result
+
+
+def _rol(x, n):
+    return ((x << n) | (x >> (32 - n))) & _MASK
+
+
+def _ror(x, n):
+    return ((x >> n) | (x << (32 - n))) & _MASK
+
+
+class Twofish:
+    """Twofish with an expanded key.
+
+    key        bytes        16, 24 or 32 byte key
+    """
+
+    def __init__(self, key):
+        if len(key) not in (16, 24, 32):
+            raise ValueError("Twofish key must be 16, 24 or 32 bytes")
+        k = len(key) // 8
+        words = struct.unpack("<%dI" % (2 * k), key)
+        even, odd = words[0::2], words[1::2]
+        # S words come from the RS code, in reverse order
+        sbox_words = []
+        for i in range(k):
+            chunk = key[8 * i:8 * i + 8]
+            sbox_words.append(
+                sum(
+                    _rs_row(row, chunk) << (8 * n)
+                    for n, row in enumerate(_RS)
+                )
+            )
+        sbox_words.reverse()
+        # Round subkeys
+        subkeys = []
+        rho = 0x01010101
+        for i in range(20):
+            a = _h(2 * i * rho & _MASK, even)
+            b = _rol(_h((2 * i + 1) * rho & _MASK, odd), 8)
+            subkeys.append((a + b) & _MASK)
+            subkeys.append(_rol((a + 2 * b) & _MASK, 9))
+        self.subkeys = tuple(subkeys)
+        # g function tables: key dependent S-box followed by MDS column
+        tables = []
+        for j in range(4):
+            key_bytes = [(w >> (8 * j)) & 0xFF for w in sbox_words]
+            tables.append(
+                tuple(_mds_column(j, _sbox(j, x, key_bytes)) for x in range(256))
+            )
+        self.tables = tuple(tables)
+        self._np_tables = None
+
+    def encrypt_block(self, a, b, c, d):
+        """Encrypt one block given as four little-endian words."""
+        t0, t1, t2, t3 = self.tables
+        k = self.subkeys
+        a ^= k[0]
+        b ^= k[1]
+        c ^= k[2]
+        d ^= k[3]
+        for r in range(8, 40, 4):
+            x = t0[a & 0xFF] ^ t1[a >> 8 & 0xFF] ^ t2[a >> 16 & 0xFF] ^ t3[a >> 24]
+            y = t0[b >> 24] ^ t1[b & 0xFF] ^ t2[b >> 8 & 0xFF] ^ t3[b >> 16 & 0xFF]
+            c ^= (x + y + k[r]) & _MASK
+            c = (c >> 1 | c << 31) & _MASK
+            d = (d << 1 | d >> 31) & _MASK
+            d ^= (x + 2 * y + k[r + 1]) & _MASK
+            x = t0[c & 0xFF] ^ t1[c >> 8 & 0xFF] ^ t2[c >> 16 & 0xFF] ^ t3[c >> 24]
+            y = t0[d >> 24] ^ t1[d & 0xFF] ^ t2[d >> 8 & 0xFF] ^ t3[d >> 16 & 0xFF]
+            a ^= (x + y + k[r + 2]) & _MASK
+            a = (a >> 1 | a << 31) & _MASK
+            b = (b << 1 | b >> 31) & _MASK
+            b ^= (x + 2 * y + k[r + 3]) & _MASK
+        return c ^ k[4], d ^ k[5], a ^ k[6], b ^ k[7]
+
+    def decrypt_block(self, c, d, a, b):
+        """Decrypt one block given as four little-endian words."""
+        t0, t1, t2, t3 = self.tables
+        k = self.subkeys
+        c ^= k[4]
+        d ^= k[5]
+        a ^= k[6]
+        b ^= k[7]
+        for r in range(36, 4, -4):
+            x = t0[c & 0xFF] ^ t1[c >> 8 & 0xFF] ^ t2[c >> 16 & 0xFF] ^ t3[c >> 24]
+            y = t0[d >> 24] ^ t1[d & 0xFF] ^ t2[d >> 8 & 0xFF] ^ t3[d >> 16 & 0xFF]
+            a = (a << 1 | a >> 31) & _MASK
+            a ^= (x + y + k[r + 2]) & _MASK
+            b ^= (x + 2 * y + k[r + 3]) & _MASK
+            b = (b >> 1 | b << 31) & _MASK
+            x = t0[a & 0xFF] ^ t1[a >> 8 & 0xFF] ^ t2[a >> 16 & 0xFF] ^ t3[a >> 24]
+            y = t0[b >> 24] ^ t1[b & 0xFF] ^ t2[b >> 8 & 0xFF] ^ t3[b >> 16 & 0xFF]
+            c = (c << 1 | c >> 31) & _MASK
+            c ^= (x + y + k[r]) & _MASK
+            d ^= (x + 2 * y + k[r + 1]) & _MASK
+            d = (d >> 1 | d << 31) & _MASK
+        return a ^ k[0], b ^ k[1], c ^ k[2], d ^ k[3]
+
+    def encrypt_ecb(self, data):
+        """Encrypt whole blocks in ECB mode."""
+        words = _unpack(data)
+        out = []
+        for i in range(0, len(words), 4):
+            out.extend(self.encrypt_block(*words[i:i + 4]))
+        return _pack(out)
+
+    def decrypt_ecb(self, data):
+        """Decrypt whole blocks in ECB mode."""
+        words = _unpack(data)
+        out = []
+        for i in range(0, len(words), 4):
+            out.extend(self.decrypt_block(*words[i:i + 4]))
+        return _pack(out)
+
+    def encrypt_cbc(self, iv, data):
+        """Encrypt whole blocks in CBC mode."""
+        words = _unpack(data)
+        a, b, c, d = _unpack(iv)
+        out = []
+        for i in range(0, len(words), 4):
+            a, b, c, d = self.encrypt_block(
+                a ^ words[i], b ^ words[i + 1], c ^ words[i + 2], d ^ words[i + 3]
+            )
+            out.extend((a, b, c, d))
+        return _pack(out)
+
+    def decrypt_cbc(self, iv, data):
+        """Decrypt whole blocks in CBC mode."""
+        if numpy is not None and len(data) > BLOCK_SIZE:
+            return self._decrypt_cbc_numpy(iv, data)
+        words = _unpack(data)
+        prev = _unpack(iv)
+        out = []
+        for i in range(0, len(words), 4):
+            block = words[i:i + 4]
+            a, b, c, d = self.decrypt_block(*block)
+            out.extend((a ^ prev[0], b ^ prev[1], c ^ prev[2], d ^ prev[3]))
+            prev = block
+        return _pack(out)
+
+    def _decrypt_cbc_numpy(self, iv, data):
+        _check_length(data)
+        if self._np_tables is None:
+            self._np_tables = tuple(
+                numpy.array(t, dtype=numpy.uint32) for t in self.tables
+            )
+        t0, t1, t2, t3 = self._np_tables
+        k = [numpy.uint32(x) for x in self.subkeys]
+        blocks = numpy.frombuffer(data, dtype="<u4").reshape(-1, 4)
+        c = blocks[:, 0] ^ k[4]
+        d = blocks[:, 1] ^ k[5]
+        a = blocks[:, 2] ^ k[6]
+        b = blocks[:, 3] ^ k[7]
+
+        def g(w):
+            return t0[w & 0xFF] ^ t1[w >> 8 & 0xFF] ^ t2[w >> 16 & 0xFF] ^ t3[w >> 24]
+
+        def rol1(w):
+            return w << 1 | w >> 31
+
+        def ror1(w):
+            return w >> 1 | w << 31
+
+        def rol8(w):
+            return w << 8 | w >> 24
+
+        for r in range(36, 4, -4):
+            x = g(c)
+            y = g(rol8(d))
+            a = rol1(a) ^ (x + y + k[r + 2])
+            b = ror1(b ^ (x + y + y + k[r + 3]))
+            x = g(a)
+            y = g(rol8(b))
+            c = rol1(c) ^ (x + y + k[r])
+            d = ror1(d ^ (x + y + y + k[r + 1]))
+        out = numpy.empty_like(blocks)
+        out[:, 0] = a ^ k[0]
+        out[:, 1] = b ^ k[1]
+        out[:, 2] = c ^ k[2]
+        out[:, 3] = d ^ k[3]
+        out[0] ^= numpy.frombuffer(iv, dtype="<u4")
+        out[1:] ^= blocks[:-1]
+        return out.astype("<u4", copy=False).tobytes()
+
+
+def _rs_row(row, chunk):
+    result = 0
+    for coef, byte in zip(row, chunk):
+        result ^= _gf_mul(coef, byte, _RS_POLY)
+    return result
+
+
+def _check_length(data):
+    if len(data) % BLOCK_SIZE:
+        raise ValueError("Data length must be a multiple of %d" % BLOCK_SIZE)
+
+
+def _unpack(data):
+    _check_length(data)
+    return struct.unpack("<%dI" % (len(data) // 4), data)
+
+
+def _pack(words):
+    return struct.pack("<%dI" % len(words), *words)
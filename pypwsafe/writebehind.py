@@ -0,0 +1,265 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+"""Write-behind saving of Password Safe v3 files.
+
+A WriteBehind saver takes over PWSafe3.save(): it only counts the change,
+and a background thread saves the safe once the oldest unsaved change is
+interval seconds old or max_changes changes have piled up. Each save holds
+the .plk lock of the safe while the file is written; PWSafe3.lock() and
+unlock() wait for a write in progress.
+
+The thread reads the headers and records while it serializes them, so
+other threads should change the safe inside changes() or while holding
+mutex. Don't close the saver while holding mutex.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from . import errors
+
+
+log = logging.getLogger("psafe.lib.writebehind")
+log.debug("initing")
+
+# Seconds before a failed save is retried if there is no interval
+RETRY_DELAY = 1.0
+
+
+class WriteBehind:
+    """Coalesce the saves of a PWSafe3 into one per interval or max_changes.
+
+    safe        PWSafe3        The safe that is saved
+    interval        float        Seconds the oldest unsaved change waits for a save. None to only save after max_changes.
+    max_changes        int        Save as soon as this many changes are unsaved. None for no limit.
+    durability        string        Durability of each save. None for the safe's durability attribute.
+    mutex        RLock        Held while the safe is changed or serialized
+    """
+
+    def __init__(self, safe, interval=1.0, max_changes=None, durability=None):
+        """
+        @param safe: The safe to save. It must be read/write.
+        @type safe: PWSafe3
+        @param interval: Seconds the oldest unsaved change waits for a save. None to only save after max_changes.
+        @type interval: float
+        @param max_changes: Save as soon as this many changes are unsaved. None for no limit.
+        @type max_changes: int
+        @param durability: Durability of each save. None for the safe's durability attribute.
+        @type durability: string
+        """
+        if safe.mode != "RW":
+            raise errors.ROSafe("Safe is not in read/write mode")
+        if interval is None and max_changes is None:
+            raise ValueError("Give interval, max_changes or both")
+        if interval is not None and interval < 0:
+            raise ValueError("interval can't be negative")
+        if max_changes is not None and max_changes < 1:
+            raise ValueError("max_changes must be at least 1")
+        if safe.write_behind is not None:
+            raise ValueError("Safe already has a write-behind saver")
+        self.safe = safe
+        self.interval = interval
+        self.max_changes = max_changes
+        self.durability = durability
+        self.mutex = threading.RLock()
+        self._cond = threading.Condition(self.mutex)
+        # Only one write at a time, the lock file is held during it
+        self._writing = False
+        # The lock file was taken for the write, not by the caller
+        self._lock_owned = False
+        # Thread inside changes(), which must not close the saver
+        self._changer = None
+        self._changes = 0
+        self._first_change = None
+        self._retry_at = None
+        # Serializations are numbered so an older one is never written over a newer one
+        self._serialized = 0
+        self._written = 0
+        self._closed = False
+        safe.write_behind = self
+        self._thread = threading.Thread(
+            target=self._run, name="pypwsafe-writebehind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def pending(self):
+        """Number of changes that are not saved yet."""
+        return self._changes
+
+    def mark_dirty(self, changes=1):
+        """Count changes to the safe that should be saved."""
+        with self._cond:
+            if not self._changes:
+                self._first_change = time.monotonic()
+            self._changes += changes
+            self._cond.notify()
+
+    @contextmanager
+    def changes(self):
+        """Hold mutex while the safe is changed and count one change after.
+
+        >>> with saver.changes() as safe:
+        ...     safe.records[0].setPassword(new_password)
+        """
+        with self.mutex:
+            outer = self._changer
+            self._changer = threading.get_ident()
+            try:
+                yield self.safe
+            finally:
+                self._changer = outer
+            self.mark_dirty()
+
+    def lock(self):
+        """Lock the safe once no write is in progress. Called by PWSafe3.lock."""
+        with self._cond:
+            while self._writing:
+                self._cond.wait()
+            self.safe._lock()
+
+    def unlock(self):
+        """Unlock the safe once no write is in progress. Called by PWSafe3.unlock."""
+        with self._cond:
+            while self._writing:
+                self._cond.wait()
+            self.safe._unlock()
+
+    def flush(self):
+        """Save the unsaved changes now and wait for it.
+
+        Returns True if the safe was saved. Errors of the save are raised,
+        and the changes are kept for the next try.
+        """
+        with self.mutex:
+            changes = self._changes
+            if not changes:
+                return False
+            first_change = self._first_change
+            self._changes = 0
+            self._first_change = None
+            start = time.perf_counter()
+            try:
+                self.safe.serialiaze()
+            except BaseException:
+                self._unsaved(changes, first_change)
+                raise
+            data = self.safe.flfull
+            serialized = time.perf_counter() - start
+            self._serialized += 1
+            number = self._serialized
+        # Writing only needs the serialized data, so changes can go on
+        try:
+            with self._cond:
+                while self._writing:
+                    self._cond.wait()
+                if number < self._written:
+                    # A later flush already wrote these changes
+                    return True
+                if not self.safe.locked:
+                    self.safe._lock()
+                    self._lock_owned = True
+                self._writing = True
+            try:
+                self.safe._write(data, self.durability, serialized)
+                self._written = number
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+                    if self._lock_owned:
+                        self._lock_owned = False
+                        self.safe._unlock()
+        except BaseException:
+            self._unsaved(changes, first_change)
+            raise
+        self._retry_at = None
+        log.debug("Saved %d changes to %r", changes, self.safe.filename)
+        return True
+
+    def _unsaved(self, changes, first_change):
+        """Count the changes of a failed save again."""
+        with self._cond:
+            if self._first_change is not None:
+                first_change = min(first_change, self._first_change)
+            self._changes += changes
+            self._first_change = first_change
+
+    def close(self):
+        """Save any unsaved changes and stop the thread.
+
+        The safe saves itself on save() again afterwards. Also run at exit.
+        Raises RuntimeError inside changes(), where joining the thread could
+        deadlock.
+        """
+        if self._changer == threading.get_ident():
+            raise RuntimeError("Can't close %r inside changes()" % self)
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        atexit.unregister(self.close)
+        try:
+            self.flush()
+        finally:
+            self.safe.write_behind = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def _due(self):
+        """Return the seconds until the next save is due, or None if nothing is unsaved."""
+        if not self._changes:
+            return None
+        now = time.monotonic()
+        if self._retry_at is not None and now < self._retry_at:
+            return self._retry_at - now
+        if self.max_changes is not None and self._changes >= self.max_changes:
+            return 0
+        if self.interval is None:
+            return None
+        return max(0, self._first_change + self.interval - now)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    wait = self._due()
+                    if wait == 0:
+                        break
+                    self._cond.wait(wait)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Write-behind save of %r failed", self.safe.filename)
+                with self._cond:
+                    self._retry_at = time.monotonic() + (self.interval or RETRY_DELAY)
+
+    def __repr__(self):
+        return "WriteBehind(%r)" % self.safe.filename
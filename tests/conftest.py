@@ -18,16 +18,63 @@ TEST_PASSWORD = "bogus12345"
 
 
 @fixture()
-def test_safe():
-    """Function for opening a given test safe in a given mode."""
+def test_password():
+    """The password of all test safes."""
+    return TEST_PASSWORD
+
+
+@fixture()
+def test_safe_path():
+    """Function for getting the path of a given test safe. Don't write to it."""
+
+    def _get_path(name):
+        return TEST_SAFES / name
+
+    return _get_path
+
+
+@fixture()
+def test_safe_copy():
+    """Function for copying a given test safe to a temporary or given path."""
     safe_dir = mkdtemp(prefix="pypwsafe_test_")
 
+    def _copy_safe(name, dest=None):
+        if dest is None:
+            dest = Path(safe_dir) / name
+        copyfile(TEST_SAFES / name, dest)
+        return dest
+
+    yield _copy_safe
+
+    rmtree(safe_dir)
+
+
+@fixture()
+def test_safe(test_safe_copy):
+    """Function for opening a given test safe in a given mode."""
+
     def _get_safe(name, mode):
-        safe_path = TEST_SAFES / name
-        safe_copy = Path(safe_dir) / name
-        copyfile(safe_path, safe_copy)
+        safe_copy = test_safe_copy(name)
         return PWSafe3(filename=safe_copy, password=TEST_PASSWORD, mode=mode)
 
-    yield _get_safe
+    return _get_safe
 
-    rmtree(safe_dir)
+
+@fixture()
+def new_safe(tmp_path):
+    """Function for creating a new, unsaved safe with the minimum iterations."""
+
+    def _new_safe(name="new.psafe3"):
+        return PWSafe3(str(tmp_path / name), TEST_PASSWORD, iterations=2048)
+
+    return _new_safe
+
+
+@fixture()
+def reopen():
+    """Function for opening the file of a given safe again."""
+
+    def _reopen(safe, mode="RO", **kwargs):
+        return PWSafe3(safe.filename, TEST_PASSWORD, mode=mode, **kwargs)
+
+    return _reopen
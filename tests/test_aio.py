@@ -0,0 +1,66 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import asyncio
+import os
+
+from pypwsafe import PWSafe3
+from pypwsafe.aio import aopen
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def test_aopen_should_load_safe(test_password, test_safe_copy):
+    path = test_safe_copy(SAFE_FILENAME)
+    safe = asyncio.run(aopen(path, test_password, mode="RO"))
+    assert len(safe) == 9
+    assert safe.getEmptyGroups() == PWSafe3(path, test_password, "RO").getEmptyGroups()
+
+
+def test_event_loop_should_keep_running_during_unlock(tmp_path, test_password):
+    path = tmp_path / "slow.psafe3"
+    safe = PWSafe3(path, test_password, iterations=2**19)
+    safe.serialiaze()
+    path.write_bytes(safe.flfull)
+
+    async def main():
+        ticks = 0
+        opening = asyncio.ensure_future(aopen(path, test_password, mode="RO"))
+        while not opening.done():
+            ticks += 1
+            await asyncio.sleep(0)
+        await opening
+        return ticks
+
+    assert asyncio.run(main()) > 1
+
+
+def test_lock_and_unlock_should_be_awaitable(test_password, test_safe_copy):
+    path = test_safe_copy(SAFE_FILENAME)
+
+    async def main():
+        safe = await aopen(path, test_password)
+        await safe.lock()
+        assert os.path.exists(safe.locked)
+        await safe.unlock()
+        assert not safe.locked
+        await safe.load()
+        return safe
+
+    safe = asyncio.run(main())
+    assert len(safe) == 9
@@ -0,0 +1,147 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import os
+
+import pypwsafe
+from pypwsafe import PWSafe3, consts, errors
+from pypwsafe.records import Record
+
+
+def new_record(title):
+    record = Record()
+    record.setTitle(title)
+    return record
+
+
+def count_calls(monkeypatch, name):
+    calls = []
+    func = getattr(PWSafe3, name)
+
+    def counting(self, *args, **kw):
+        calls.append(args)
+        return func(self, *args, **kw)
+
+    monkeypatch.setattr(PWSafe3, name, counting)
+    return calls
+
+
+def test_batch_should_save_once(monkeypatch, new_safe, reopen):
+    safe = new_safe()
+    calls = count_calls(monkeypatch, "serialiaze")
+    with safe.batch():
+        for i in range(5):
+            safe.records.append(new_record("entry %d" % i))
+            safe.save()
+        assert not os.path.exists(safe.filename)
+    assert len(calls) == 1
+    reopened = reopen(safe, "RO")
+    assert len(reopened.records) == 5
+
+
+def test_batch_should_update_auto_headers_once(monkeypatch, new_safe):
+    safe = new_safe()
+    calls = count_calls(monkeypatch, "setLastSaveHost")
+    with safe.batch(save=False):
+        safe.setDbName("name")
+        safe.setDbDesc("desc")
+        safe.setLastSaveApp("app")
+    assert len(calls) == 1
+    assert safe.getLastSaveApp() == "app"
+    assert not os.path.exists(safe.filename)
+
+
+def test_batch_should_roll_back_on_error(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RW")
+    with open(safe.filename, "rb") as fl:
+        before = fl.read()
+    records = safe.records
+    title = records[0].getTitle()
+    count = len(records)
+    with pytest.raises(KeyError):
+        with safe.transaction():
+            safe.records[0].setTitle("changed")
+            safe.records.append(new_record("added"))
+            safe.setDbName("renamed")
+            raise KeyError("failed")
+    assert safe.records is records
+    assert len(safe.records) == count
+    assert safe.records[0].getTitle() == title
+    assert safe.getDbName() != "renamed"
+    with open(safe.filename, "rb") as fl:
+        assert fl.read() == before
+
+
+def test_batch_should_roll_back_lazy_records(test_safe, reopen):
+    safe = test_safe("EmptyGroupTest.psafe3", "RW")
+    lazy = reopen(safe, "RW", lazy=True)
+    titles = [r.getTitle() for r in safe.records]
+    with pytest.raises(KeyError):
+        with lazy.batch():
+            lazy.records[0].setTitle("changed")
+            del lazy.records[-1]
+            raise KeyError("failed")
+    assert [r.getTitle() for r in lazy.records] == titles
+    assert lazy.current_hmac() == lazy.hmac
+
+
+def test_failed_save_should_roll_back(monkeypatch, new_safe):
+    safe = new_safe()
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pypwsafe.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        with safe.batch():
+            safe.records.append(new_record("lost"))
+    assert safe.records == []
+
+
+def test_nested_batch_should_join_outer(monkeypatch, new_safe):
+    safe = new_safe()
+    calls = count_calls(monkeypatch, "serialiaze")
+    with safe.batch():
+        for i in range(3):
+            with safe.batch():
+                safe.records.append(new_record("entry %d" % i))
+        assert calls == []
+    assert len(calls) == 1
+
+
+def test_batch_should_pass_durability(monkeypatch, new_safe):
+    safe = new_safe()
+    fsyncs = []
+    monkeypatch.setattr(pypwsafe.os, "fsync", fsyncs.append)
+    with safe.batch(save=False):
+        safe.save(consts.DURABILITY_NONE)
+    assert os.path.exists(safe.filename)
+    assert fsyncs == []
+    with pytest.raises(ValueError):
+        with safe.batch(durability="sometimes"):
+            pass
+
+
+def test_batch_on_read_only_safe_should_fail(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    with pytest.raises(errors.ROSafe):
+        with safe.batch():
+            pass
+    with safe.batch(save=False):
+        pass
@@ -0,0 +1,95 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+from pypwsafe import blocks, headers, records
+
+
+def test_block_reader_should_move_cursor_over_data():
+    data = bytes(range(64))
+    reader = blocks.BlockReader(data)
+    assert reader() == data[:16]
+    assert reader(2) == data[16:48]
+    assert reader.offset == 48
+    assert reader.has_more()
+    assert reader() == data[48:]
+    assert not reader.has_more()
+
+
+def test_block_reader_should_raise_eof_without_moving():
+    reader = blocks.BlockReader(bytes(32))
+    with pytest.raises(EOFError):
+        reader(3)
+    assert reader.offset == 0
+
+
+def test_parsers_should_fetch_fields_spanning_blocks():
+    title = records.TitleRecordProp()
+    title.set("a title that spans more than one block")
+    eoe = records.EOERecordProp()
+    reader = blocks.BlockReader(title.serialiaze() + eoe.serialiaze())
+    prop = records.Create_Prop(reader)
+    assert prop.get() == b"a title that spans more than one block"
+    assert type(records.Create_Prop(reader)) is records.EOERecordProp
+    assert not reader.has_more()
+
+
+def test_header_parser_should_use_block_reader():
+    reader = blocks.BlockReader(headers.EOFHeader().serialiaze())
+    assert type(headers.Create_Header(reader)) is headers.EOFHeader
+    assert reader.offset == 16
+
+
+def test_loaded_safe_should_consume_whole_body(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    reader = blocks.BlockReader(safe.fulldata)
+    safe._parse_body(reader)
+    assert reader.offset == len(safe.fulldata)
+
+
+def test_padded_len_should_round_up_to_blocks():
+    assert [blocks.padded_len(n) for n in (0, 11, 12, 27, 28)] == [16, 16, 32, 32, 48]
+
+
+def test_pack_fields_should_draw_padding_once(monkeypatch):
+    calls = []
+    urandom = blocks.os.urandom
+
+    def counting_urandom(n):
+        calls.append(n)
+        return urandom(n)
+
+    monkeypatch.setattr(blocks.os, "urandom", counting_urandom)
+    fields = [(0x03, b"title"), (0x05, b"n" * 40), (0xFF, b"")]
+    packed = blocks.pack_fields(iter(fields))
+    assert len(packed) == 16 + 48 + 16
+    assert calls == [len(packed) - sum(5 + len(data) for _, data in fields)]
+    reader = blocks.BlockReader(packed)
+    assert [records._fetch_field(reader)[:2] for _ in fields] == [
+        (0x03, 5), (0x05, 40), (0xFF, 0)
+    ]
+    assert packed[16 + 5:16 + 45] == b"n" * 40
+
+
+def test_serialized_safe_should_reload(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    safe.serialiaze()
+    assert isinstance(safe.fulldata, bytearray)
+    reader = blocks.BlockReader(safe.fulldata)
+    safe._parse_body(reader)
+    assert reader.offset == len(safe.fulldata)
@@ -0,0 +1,87 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+from pytest import fixture, mark, raises
+
+import os
+
+from pypwsafe import ciphers, twofish
+
+
+@fixture
+def python_backend():
+    ciphers.set_backend("python")
+    yield
+    ciphers.set_backend(None)
+
+
+# Known answer tests from the Twofish paper
+@mark.parametrize(
+    ("key", "expected"),
+    [
+        (bytes(16), "9f589f5cf6122c32b6bfec2f2ae8c35a"),
+        (
+            bytes.fromhex("0123456789abcdeffedcba98765432100011223344556677"),
+            "cfd1d2e5a9be9cdf501f13b892bd2248",
+        ),
+        (bytes(32), "57ff739d4dc92c1bd7fc01700cc8216f"),
+    ],
+)
+def test_twofish_should_match_known_answers(key, expected):
+    assert twofish.Twofish(key).encrypt_ecb(bytes(16)).hex() == expected
+
+
+def test_twofish_cbc_should_round_trip_with_and_without_numpy(monkeypatch):
+    cipher = twofish.Twofish(os.urandom(32))
+    iv, data = os.urandom(16), os.urandom(16 * 50)
+    encrypted = cipher.encrypt_cbc(iv, data)
+    assert cipher.decrypt_cbc(iv, encrypted) == data
+    monkeypatch.setattr(twofish, "numpy", None)
+    assert cipher.decrypt_cbc(iv, encrypted) == data
+
+
+def test_twofish_should_reject_partial_blocks():
+    with raises(ValueError):
+        twofish.Twofish(bytes(32)).encrypt_ecb(bytes(15))
+
+
+@mark.parametrize("name", ciphers.available_backends())
+def test_backends_should_agree_with_python_backend(name):
+    backend = ciphers.get_backend(name)
+    reference = ciphers.get_backend("python")
+    key, iv, data = os.urandom(32), os.urandom(16), os.urandom(16 * 20)
+    assert backend.ecb_encrypt(key, data) == reference.ecb_encrypt(key, data)
+    encrypted = backend.cbc_encrypt(key, iv, data)
+    assert encrypted == reference.cbc_encrypt(key, iv, data)
+    assert backend.cbc_decrypt(key, iv, encrypted) == data
+    # input buffers are left alone
+    assert reference.cbc_decrypt(key, iv, encrypted) == data
+
+
+def test_unknown_backend_should_be_rejected():
+    with raises(ValueError):
+        ciphers.get_backend("rot13")
+
+
+def test_safe_should_load_and_save_with_python_backend(test_safe, python_backend, reopen):
+    safe = test_safe("EmptyGroupTest.psafe3", "RW")
+    assert len(safe) == 9
+    safe.serialiaze()
+    with open(safe.filename, "wb") as fl:
+        fl.write(safe.flfull)
+    ciphers.set_backend(None)
+    assert len(reopen(safe, "RO")) == 9
@@ -0,0 +1,128 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import datetime
+
+from pypwsafe import headers, trace
+from pypwsafe.records import Record
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def serialized(func):
+    with trace.collect() as events:
+        result = func()
+    return result, [e for e in events if e.event == "serialize"]
+
+
+def test_clean_safe_should_not_serialize_again(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.serialiaze()
+    _, events = serialized(safe.serialiaze)
+    assert events == []
+
+
+def test_edit_should_serialize_changed_field_only(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.serialiaze()
+    safe.records[0].setTitle("changed", updateEntryModified=False)
+    _, events = serialized(safe.serialiaze)
+    assert [e.value for e in events] == [b"changed"]
+
+
+def test_accessor_should_mark_entry_modified(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.serialiaze()
+    safe.records[0].setTitle("changed")
+    _, events = serialized(safe.serialiaze)
+    assert len(events) == 2
+
+
+def test_new_field_should_be_serialized(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.serialiaze()
+    record = safe.records[0]
+    before = len(record)
+    record["EmailAddress"] = "someone@example.com"
+    assert b"someone@example.com" in record.hmac_data()
+    assert len(record._fields()) == before + 1
+
+
+def test_history_should_be_serialized(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    record = safe.records[0]
+    first = record.hmac_data()
+    record.appendHistory("old", datetime.datetime(2020, 1, 1))
+    assert record.hmac_data() != first
+
+
+def test_header_setter_should_serialize_header(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.serialiaze()
+    safe.setDbName("renamed", updateAutoData=False)
+    _, events = serialized(safe.serialiaze)
+    assert [e.value for e in events] == [b"renamed"]
+
+
+def test_prefs_should_be_serialized_after_change(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    before = safe.current_hmac()
+    safe.setDbPref("IdleTimeout", 42, updateAutoData=False)
+    assert safe.current_hmac() != before
+
+
+def test_direct_changes_should_be_saved(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.save()
+    safe.records[0].lk["Title"].title = b"direct"
+    safe.records[1].lk["Title"].set("set")
+    safe.save()
+    reopened = reopen(safe, "RO")
+    assert [r.getTitle() for r in reopened.records[:2]] == [b"direct", b"set"]
+
+
+def test_direct_header_changes_should_be_saved(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.setDbName("before")
+    safe.save()
+    [hdr] = [h for h in safe.headers if isinstance(h, headers.DBNameHeader)]
+    hdr.dbName = "direct"
+    safe.save()
+    reopened = reopen(safe, "RO")
+    assert reopened.getDbName() == b"direct"
+
+
+def test_in_place_changes_should_be_saved():
+    record = Record()
+    record.appendHistory("old", datetime.datetime(2020, 1, 1))
+    before = record.hmac_data()
+    record.lk["PasswordHistory"].history.append(
+        (datetime.datetime(2021, 1, 1).timetuple(), "older")
+    )
+    assert record.hmac_data() != before
+
+
+def test_saved_edit_should_verify(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.save()
+    safe.records[0].setUsername("someone")
+    safe.save()
+    reopened = reopen(safe, "RO")
+    assert reopened.hmac_verified
+    assert reopened.records[0].getUsername() == b"someone"
+    assert reopened.current_hmac() == safe.current_hmac()
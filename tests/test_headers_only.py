@@ -0,0 +1,83 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import logging
+import os
+
+from pypwsafe import PWSafe3, blocks, ciphers, errors
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def test_headers_only_should_give_same_metadata(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    meta = reopen(safe, "RW", headers_only=True)
+    assert meta.getVersion() == safe.getVersion()
+    assert meta.getEmptyGroups() == safe.getEmptyGroups()
+    assert meta.getLastSaveUser() == safe.getLastSaveUser()
+    assert meta.getTimeStampOfLastSave() == safe.getTimeStampOfLastSave()
+    assert [h.data for h in meta.headers] == [h.data for h in safe.headers]
+
+
+def test_headers_only_should_flag_unverified_hmac(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    assert safe.hmac_verified
+    meta = reopen(safe, "RW", headers_only=True)
+    assert meta.hmac_verified is False
+    assert meta.records == []
+
+
+def test_headers_only_should_be_read_only(test_safe, reopen):
+    meta = reopen(test_safe(SAFE_FILENAME, "RO"), "RW", headers_only=True)
+    assert meta.mode == "RO"
+    with pytest.raises(errors.ROSafe):
+        meta.save()
+
+
+def test_headers_only_should_decrypt_a_prefix(test_safe, monkeypatch, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    monkeypatch.setattr(blocks, "HEADERS_CHUNK_SIZE", 16)
+    backend = ciphers.get_backend()
+    decrypted = []
+    original = backend.cbc_decrypt
+
+    def spy(key, iv, data):
+        decrypted.append(len(data))
+        return original(key, iv, data)
+
+    monkeypatch.setattr(backend, "cbc_decrypt", spy)
+    reopen(safe, "RW", headers_only=True)
+    header_bytes = sum(len(h.serialiaze()) for h in safe.headers)
+    assert sum(decrypted) == header_bytes
+    assert sum(decrypted) < os.path.getsize(safe.filename) - 200
+
+
+def test_headers_only_should_reject_bad_password(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    with pytest.raises(errors.PasswordError):
+        PWSafe3(safe.filename, "wrong", headers_only=True)
+
+
+def test_headers_only_should_not_warn(test_safe, caplog, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    caplog.clear()
+    meta = reopen(safe, "RW", headers_only=True)
+    assert meta.hmac_verified is False
+    assert [r for r in caplog.records if r.levelno >= logging.WARNING] == []
@@ -0,0 +1,58 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+from pypwsafe import errors
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def test_loaded_hmac_should_match_full_recalculation(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    assert safe.current_hmac(cached=True) == safe.hmac
+
+
+def test_hmac_should_follow_changes(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    before = safe.current_hmac()
+    safe.records[-1].setTitle("changed")
+    assert safe.current_hmac() != before
+    safe.serialiaze()
+    assert safe.current_hmac() == safe.hmac
+
+
+def test_saved_hmac_should_verify_on_reload(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.records[0].setTitle("changed")
+    safe.serialiaze()
+    assert safe.hmac == safe.current_hmac()
+    with open(safe.filename, "wb") as fl:
+        fl.write(safe.flfull)
+    assert reopen(safe, "RO").records[0].getTitle() == b"changed"
+
+
+def test_wrong_hmac_should_fail_load(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    with open(safe.filename, "rb") as fl:
+        data = bytearray(fl.read())
+    data[-32:] = bytes(32)
+    with open(safe.filename, "wb") as fl:
+        fl.write(data)
+    with pytest.raises(errors.InvalidHMACError):
+        reopen(safe, "RO")
@@ -0,0 +1,85 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import pypwsafe
+from pypwsafe import PWSafe3, calibrate_iterations
+from pypwsafe.consts import MIN_HASH_ITERATIONS
+
+
+def test_calibration_should_not_go_below_format_minimum():
+    assert calibrate_iterations(0.001, min_sample_ms=1) == MIN_HASH_ITERATIONS
+
+
+def test_calibration_should_scale_with_target():
+    iterations = calibrate_iterations(200, min_sample_ms=5)
+    assert iterations > MIN_HASH_ITERATIONS
+
+
+def test_calibration_should_refuse_non_positive_target():
+    with pytest.raises(ValueError):
+        calibrate_iterations(0)
+
+
+def test_new_safe_should_default_to_minimum_iterations(tmp_path, test_password):
+    safe = PWSafe3(tmp_path / "new.psafe3", test_password)
+    assert safe.iter == MIN_HASH_ITERATIONS
+
+
+def test_new_safe_should_use_given_iterations(tmp_path, test_password):
+    path = tmp_path / "new.psafe3"
+    safe = PWSafe3(path, test_password, iterations=5000)
+    safe.serialiaze()
+    path.write_bytes(safe.flfull)
+    assert PWSafe3(path, test_password, mode="RO").iter == 5000
+
+
+def test_new_safe_should_calibrate_to_target(tmp_path, monkeypatch, test_password):
+    monkeypatch.setattr(pypwsafe, "calibrate_iterations", lambda target_ms: 12345)
+    safe = PWSafe3(tmp_path / "new.psafe3", test_password, target_unlock_ms=250)
+    assert safe.iter == 12345
+
+
+def test_new_safe_should_refuse_conflicting_options(tmp_path, test_password):
+    with pytest.raises(ValueError):
+        PWSafe3(tmp_path / "new.psafe3", test_password, iterations=4096, target_unlock_ms=250)
+
+
+def test_new_safe_should_refuse_too_few_iterations(tmp_path, test_password):
+    with pytest.raises(ValueError):
+        PWSafe3(tmp_path / "new.psafe3", test_password, iterations=16)
+
+
+@pytest.mark.parametrize("iterations", [0, -1, 2**32])
+def test_new_safe_should_refuse_out_of_range_iterations(tmp_path, iterations, test_password):
+    with pytest.raises(ValueError):
+        PWSafe3(tmp_path / "new.psafe3", test_password, iterations=iterations)
+
+
+@pytest.mark.parametrize("target", [0, -250])
+def test_new_safe_should_refuse_non_positive_target(tmp_path, target, test_password):
+    with pytest.raises(ValueError):
+        PWSafe3(tmp_path / "new.psafe3", test_password, target_unlock_ms=target)
+
+
+def test_existing_safe_should_warn_about_iterations(test_safe, caplog, reopen):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    caplog.clear()
+    reopened = reopen(safe, "RO", iterations=5000)
+    assert reopened.iter == safe.iter
+    assert "Ignoring iterations" in caplog.text
@@ -0,0 +1,58 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+from pypwsafe.records import LazyRecord, TitleRecordProp
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def test_lazy_safe_should_list_same_entries(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    lazy = reopen(safe, "RW", lazy=True)
+    assert all(isinstance(r, LazyRecord) for r in lazy.records)
+    assert list(lazy.listall()) == list(safe.listall())
+    assert [len(r) for r in lazy.records] == [len(r) for r in safe.records]
+
+
+def test_title_scan_should_only_parse_titles(test_safe, reopen):
+    lazy = reopen(test_safe(SAFE_FILENAME, "RO"), "RW", lazy=True)
+    titles = [r.getTitle() for r in lazy.records]
+    assert titles == [r.getTitle() for r in test_safe(SAFE_FILENAME, "RO").records]
+    for record in lazy.records:
+        assert record._records is None
+        assert [type(p) for p in record._props.values()] == [TitleRecordProp]
+
+
+def test_untouched_lazy_records_should_give_file_hmac(test_safe, reopen):
+    lazy = reopen(test_safe(SAFE_FILENAME, "RO"), "RW", lazy=True)
+    assert lazy.current_hmac(cached=True) == lazy.hmac
+
+
+def test_changed_lazy_record_should_save(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    lazy = reopen(safe, "RW", lazy=True)
+    lazy.records[0].setTitle("changed")
+    assert lazy.records[0]._records is not None
+    lazy.serialiaze()
+    with open(lazy.filename, "wb") as fl:
+        fl.write(lazy.flfull)
+    reopened = reopen(safe, "RO")
+    assert reopened.records[0].getTitle() == b"changed"
+    assert [r.getTitle() for r in reopened.records[1:]] == [
+        r.getTitle() for r in safe.records[1:]
+    ]
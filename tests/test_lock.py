@@ -0,0 +1,80 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import os
+import socket
+
+from pypwsafe import errors
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def lock_file(safe):
+    return os.path.splitext(safe.filename)[0] + ".plk"
+
+
+def write_lock(safe, data):
+    with open(lock_file(safe), "w") as fl:
+        fl.write(data)
+
+
+def dead_pid():
+    pid = os.fork()
+    if not pid:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+
+def test_lock_should_write_owner(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.lock()
+    with open(lock_file(safe), "rb") as fl:
+        assert fl.read() == safe._get_lock_data().encode("utf-8")
+    safe.unlock()
+    assert not os.path.exists(lock_file(safe))
+
+
+def test_lock_of_live_process_should_fail(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.lock()
+    other = reopen(safe, "RW")
+    with pytest.raises(errors.AlreadyLockedError):
+        other.lock()
+    assert not other.locked
+    safe.unlock()
+
+
+def test_stale_lock_should_be_taken_over(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    write_lock(safe, "someone@%s:%d" % (socket.gethostname(), dead_pid()))
+    safe.lock()
+    assert safe.locked == lock_file(safe)
+    safe.unlock()
+
+
+@pytest.mark.parametrize("data", ["someone@otherhost:1", "garbage"])
+def test_foreign_lock_should_fail(test_safe, data):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    write_lock(safe, data)
+    with pytest.raises(errors.AlreadyLockedError):
+        safe.lock()
+    assert not safe.locked
+    assert os.path.exists(lock_file(safe))
@@ -0,0 +1,64 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import mmap
+
+from pypwsafe import PWSafe3, errors
+
+
+def contents(safe):
+    return (
+        [hdr.data for hdr in safe.headers],
+        [rec.hmac_data() for rec in safe.records],
+    )
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_mapped_safe_should_match_regular_load(test_safe, stream, reopen):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    mapped = reopen(safe, "RO", mmap=True, stream=stream)
+    assert contents(mapped) == contents(safe)
+    assert (mapped.salt, mapped.iter, mapped.hmac) == (safe.salt, safe.iter, safe.hmac)
+    assert mapped.flfull is None
+    assert mapped.cryptdata is None
+
+
+def test_mapping_should_not_be_referenced_after_load(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    with open(safe.filename, "rb") as fl:
+        mapped = mmap.mmap(fl.fileno(), 0, access=mmap.ACCESS_READ)
+        safe.load_mapped(mapped)
+        # raises BufferError if a view on the mapping is still alive
+        mapped.close()
+    assert len(safe) == 9
+
+
+def test_mapped_safe_should_reject_bad_password(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    with pytest.raises(errors.PasswordError):
+        PWSafe3(safe.filename, "wrong", mode="RO", mmap=True)
+
+
+def test_mapped_safe_should_save(test_safe, reopen):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    mapped = reopen(safe, "RW", mmap=True)
+    mapped.serialiaze()
+    with open(mapped.filename, "wb") as fl:
+        fl.write(mapped.flfull)
+    assert contents(reopen(safe, "RO")) == contents(safe)
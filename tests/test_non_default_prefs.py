@@ -17,7 +17,13 @@
 
 # original author: Paulson McIntyre <paul@gpmidi.net>
 
+from pytest import raises
+
+from struct import pack
+
 from pypwsafe.consts import conf_bools, conf_ints, conf_strs, ptDatabase
+from pypwsafe.errors import ConfigItemNotFoundError, PrefsDataTypeError
+from pypwsafe.headers import NonDefaultPrefsHeader
 
 
 SAFE_FILENAME = "NonDefaultPrefsTest.psafe3"
@@ -48,3 +54,44 @@ def test_non_db_level_settings_should_not_be_stored(test_safe):
 
 
 # TODO: Add a check to make sure default values aren't being saved
+
+
+def make_prefs(data):
+    return NonDefaultPrefsHeader(2, len(data), pack("=lc", len(data), b"\x02") + data)
+
+
+def test_string_prefs_should_keep_spaces():
+    hdr = make_prefs(b"B 1 1 S 3 'a b\"c' I 12 255 S 10 \"x'y\" ")
+    assert hdr.opts["ShowPWDefault"] is True
+    assert hdr.opts["DefaultUsername"] == "a b\"c"
+    assert hdr.opts["DefaultAutotypeString"] == "x'y"
+    assert make_prefs(hdr.serial().encode("us-ascii")).opts == hdr.opts
+
+
+def test_unknown_pref_index_should_fail():
+    with raises(ConfigItemNotFoundError):
+        make_prefs(b"B 1 1 B 255 1 ")
+
+
+def test_unknown_pref_type_should_fail():
+    with raises(PrefsDataTypeError):
+        make_prefs(b"B 1 1 X 3 1 ")
+
+
+def test_serial_should_be_cached_until_prefs_change(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    hdr = [h for h in safe.headers if isinstance(h, NonDefaultPrefsHeader)][0]
+    serial = hdr.serial()
+    assert hdr.serial() is serial
+    safe.setDbPref("ShowPWDefault", False, updateAutoData=False)
+    assert "B 1 " not in hdr.serial()
+    hdr.opts = dict(hdr.opts, DefaultUsername="someone")
+    assert "S 3 \"someone\" " in hdr.serial()
+
+
+def test_non_ascii_string_prefs_should_round_trip(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.setDbPref("DefaultUsername", "Jürgen 山田", updateAutoData=False)
+    safe.save()
+    reopened = reopen(safe, "RO")
+    assert reopened.getDbPrefs()["DefaultUsername"] == "Jürgen 山田"
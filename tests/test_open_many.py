@@ -0,0 +1,53 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import pickle
+
+from pypwsafe import errors, open_many
+
+
+def test_pickled_safe_should_not_carry_file_buffers(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    clone = pickle.loads(pickle.dumps(safe))
+    assert clone.flfull is None
+    assert clone.getEmptyGroups() == safe.getEmptyGroups()
+    assert len(clone) == len(safe)
+    clone.close()
+
+
+def test_open_many_should_collect_errors(test_password, test_safe_path):
+    good = str(test_safe_path("EmptyGroupTest.psafe3"))
+    other = str(test_safe_path("VersionTest.psafe3"))
+    bad = str(test_safe_path("LastSaveUserTest.psafe3"))
+    opened, failed = open_many(
+        [(good, test_password), (other, test_password), (bad, "wrong")], workers=2
+    )
+    assert sorted(opened) == sorted([good, other])
+    assert len(opened[good]) == 9
+    assert isinstance(failed[bad], errors.PasswordError)
+
+
+def test_open_many_should_accept_empty_batch():
+    assert open_many([]) == ({}, {})
+
+
+def test_open_many_should_refuse_duplicate_filenames(test_password, test_safe_path):
+    good = str(test_safe_path("EmptyGroupTest.psafe3"))
+    with pytest.raises(ValueError):
+        open_many([(good, test_password), (good, "wrong")])
@@ -0,0 +1,97 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import pypwsafe
+from pypwsafe import PPrimeCache, PWSafe3, errors
+
+
+SAFE_FILENAME = "VersionTest.psafe3"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def stretch_calls(monkeypatch):
+    calls = []
+    real_stretchkey = pypwsafe.stretchkey
+
+    def counting_stretchkey(*args, **kwargs):
+        calls.append(args)
+        return real_stretchkey(*args, **kwargs)
+
+    monkeypatch.setattr(pypwsafe, "stretchkey", counting_stretchkey)
+    return calls
+
+
+def test_warm_reopen_should_skip_stretching(stretch_calls, test_password, test_safe_path):
+    cache = PPrimeCache()
+    path = test_safe_path(SAFE_FILENAME)
+    PWSafe3(path, test_password, mode="RO", pprime_cache=cache)
+    safe = PWSafe3(path, test_password, mode="RO", pprime_cache=cache)
+    assert len(stretch_calls) == 1
+    assert len(safe) == 9
+
+
+def test_wrong_password_should_not_be_cached(stretch_calls, test_safe_path):
+    cache = PPrimeCache()
+    with pytest.raises(errors.PasswordError):
+        PWSafe3(test_safe_path(SAFE_FILENAME), "wrong", mode="RO", pprime_cache=cache)
+    assert len(cache) == 0
+
+
+def test_cache_should_not_match_other_password():
+    cache = PPrimeCache()
+    cache.put(b"one", b"salt", 2048, b"k" * 32)
+    assert cache.get(b"two", b"salt", 2048) is None
+    assert cache.get(b"one", b"salt", 4096) is None
+    assert cache.get(b"one", b"salt", 2048) == b"k" * 32
+
+
+def test_expired_entries_should_be_dropped():
+    clock = FakeClock()
+    cache = PPrimeCache(ttl=10, clock=clock)
+    cache.put(b"pw", b"salt", 2048, b"k" * 32)
+    clock.now = 11
+    assert cache.get(b"pw", b"salt", 2048) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_should_be_evicted():
+    cache = PPrimeCache(maxsize=2)
+    cache.put(b"a", b"salt", 2048, b"a" * 32)
+    cache.put(b"b", b"salt", 2048, b"b" * 32)
+    cache.get(b"a", b"salt", 2048)
+    cache.put(b"c", b"salt", 2048, b"c" * 32)
+    assert cache.get(b"b", b"salt", 2048) is None
+    assert cache.get(b"a", b"salt", 2048) == b"a" * 32
+
+
+def test_purge_should_zeroize_entries():
+    cache = PPrimeCache()
+    cache.put(b"pw", b"salt", 2048, b"k" * 32)
+    stored = [pprime for _, pprime in cache._entries.values()]
+    cache.purge()
+    assert len(cache) == 0
+    assert stored[0] == bytearray(32)
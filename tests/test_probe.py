@@ -0,0 +1,67 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+from pathlib import Path
+
+from pypwsafe import PWSafe3, errors, ispsafe3, probe, scan_dir
+
+
+def test_probe_should_match_loaded_safe(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    info = probe(safe.filename)
+    assert info.tag == b"PWS3"
+    assert (info.salt, info.iterations, info.hmac) == (safe.salt, safe.iter, safe.hmac)
+    assert info.size == len(safe.flfull)
+    assert info.cryptdata_len == len(safe.cryptdata)
+    assert info.trailer_ok
+
+
+def test_probe_should_flag_truncated_trailer(tmp_path, test_safe_path):
+    path = tmp_path / "truncated.psafe3"
+    path.write_bytes(test_safe_path("EmptyGroupTest.psafe3").read_bytes()[:-8])
+    assert not probe(path).trailer_ok
+
+
+@pytest.mark.parametrize("data", [b"", b"PWS3", b"not a safe" * 40])
+def test_probe_should_reject_other_files(tmp_path, data):
+    path = tmp_path / "other"
+    path.write_bytes(data)
+    with pytest.raises(errors.NotASafeError):
+        probe(path)
+    assert not ispsafe3(path) or data[:4] == b"PWS3"
+
+
+def test_ispsafe3_should_read_binary_files(test_safe_path):
+    assert ispsafe3(test_safe_path("EmptyGroupTest.psafe3"))
+
+
+def test_scan_dir_should_find_safes_and_skip_other_files(tmp_path, test_safe_copy):
+    (tmp_path / "sub").mkdir()
+    test_safe_copy("EmptyGroupTest.psafe3", tmp_path / "a.psafe3")
+    test_safe_copy("VersionTest.psafe3", tmp_path / "sub" / "b.dat")
+    (tmp_path / "notes.txt").write_text("hello")
+    weak = PWSafe3(tmp_path / "weak.psafe3", "pw")
+    weak.serialiaze()
+    (tmp_path / "weak.psafe3").write_bytes(weak.flfull)
+    found, failed = scan_dir(tmp_path, workers=4)
+    assert failed == {}
+    assert sorted(Path(f).name for f in found) == ["a.psafe3", "b.dat", "weak.psafe3"]
+    assert found[str(tmp_path / "weak.psafe3")].iterations == 2048
+    found, _ = scan_dir(tmp_path, recursive=False)
+    assert len(found) == 2
@@ -0,0 +1,52 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+from pypwsafe.records import EOERecordProp, Record, RecordProp, \
+    RecordPropNames, RecordPropTable, RecordPropTypes, TitleRecordProp, \
+    UUIDRecordProp, _make_prop
+
+
+def test_type_table_should_match_registry():
+    assert len(RecordPropTable) == 256
+    for rtype, cls in enumerate(RecordPropTable):
+        assert RecordPropTypes.get(rtype) is cls
+    for name, cls in RecordPropNames.items():
+        assert cls.rNAME == name
+
+
+def test_unknown_type_should_make_plain_prop():
+    prop = _make_prop(0x70, 3, b"\x03\x00\x00\x00\x70abc" + bytes(8))
+    assert type(prop) is RecordProp
+    assert prop.data == b"abc"
+
+
+def test_new_fields_should_go_first():
+    record = Record()
+    record.setTitle("title", updateEntryModified=False)
+    record.setUsername("user", updateEntryModified=False)
+    assert isinstance(record.records, list)
+    types = [type(p) for p in record.records]
+    assert types[1] is TitleRecordProp
+    assert types[-2:] == [UUIDRecordProp, EOERecordProp]
+    assert record["Title"] == "title"
+
+
+def test_unknown_name_should_not_add_field():
+    record = Record()
+    record._if_noitem("NoSuchField")
+    assert "NoSuchField" not in record.lk
+    assert len(record) == 2
@@ -0,0 +1,78 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+from pypwsafe.registry import RegisteredType, Registry
+
+
+def make_registry():
+    registry = Registry("test thing")
+
+    class Thing(metaclass=RegisteredType):
+        REGISTRY = registry
+        NAME = None
+        PRIORITY = 0
+
+        @classmethod
+        def available(cls):
+            return True
+
+    class Slow(Thing):
+        NAME = "slow"
+
+    class Fast(Thing):
+        NAME = "fast"
+        PRIORITY = 10
+
+    class Missing(Thing):
+        NAME = "missing"
+        PRIORITY = 20
+
+        @classmethod
+        def available(cls):
+            return False
+
+    return registry
+
+
+def test_subclasses_should_register_by_name():
+    registry = make_registry()
+    assert sorted(registry.classes) == ["fast", "missing", "slow"]
+    assert registry.available() == ["fast", "slow"]
+
+
+def test_best_available_should_be_active():
+    registry = make_registry()
+    assert registry.get().NAME == "fast"
+    assert registry.get() is registry.get()
+
+
+def test_selection_should_override_priority():
+    registry = make_registry()
+    assert registry.set("slow").NAME == "slow"
+    assert registry.get().NAME == "slow"
+    registry.set()
+    assert registry.get().NAME == "fast"
+
+
+def test_unknown_or_unavailable_names_should_fail():
+    registry = make_registry()
+    with pytest.raises(ValueError):
+        registry.get("nope")
+    with pytest.raises(ValueError):
+        registry.set("missing")
@@ -0,0 +1,81 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+from pypwsafe import PWSafe3, errors
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def read_file(safe):
+    with open(safe.filename, "rb") as f:
+        return f.read()
+
+
+def test_rekey_should_only_rewrite_preamble(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    before = read_file(safe)
+    safe.rekey("new password")
+    after = read_file(safe)
+    assert len(after) == len(before)
+    assert after[152:] == before[152:]
+    assert after[:152] != before[:152]
+
+
+def test_rekeyed_safe_should_open_with_new_password_only(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    safe.rekey("new password", new_iter=4096)
+    reopened = PWSafe3(safe.filename, "new password", mode="RO")
+    assert reopened.iter == 4096
+    assert reopened.getEmptyGroups() == safe.getEmptyGroups()
+    with pytest.raises(errors.PasswordError):
+        reopen(safe, "RO")
+
+
+def test_rekey_should_refuse_too_few_iterations(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    with pytest.raises(ValueError):
+        safe.rekey("new password", new_iter=100)
+
+
+def test_rekey_should_refuse_read_only_safe(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    with pytest.raises(errors.ROSafe):
+        safe.rekey("new password")
+
+
+def test_rekey_should_lock_safe(test_safe, monkeypatch):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    calls = []
+    monkeypatch.setattr(safe, "lock", lambda: calls.append("lock") or PWSafe3.lock(safe))
+    monkeypatch.setattr(safe, "unlock", lambda: calls.append("unlock") or PWSafe3.unlock(safe))
+    safe.rekey("new password")
+    assert calls == ["lock", "unlock"]
+    assert not safe.locked
+
+
+def test_rekey_should_refuse_changed_file(test_safe, reopen, test_password):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    other = reopen(safe, "RW")
+    other.rekey("other password")
+    with pytest.raises(errors.SafeChangedError):
+        safe.rekey("new password")
+    assert not safe.locked
+    assert safe.password == test_password.encode()
+    PWSafe3(safe.filename, "other password", mode="RO")
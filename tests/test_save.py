@@ -0,0 +1,116 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import os
+import stat
+
+import pypwsafe
+from pypwsafe import consts
+from pypwsafe.records import Record
+
+
+def with_record(safe):
+    record = Record()
+    record.setTitle("saved")
+    safe.records.append(record)
+    return safe
+
+
+def count_fsyncs(monkeypatch):
+    calls = []
+    fsync = os.fsync
+
+    def counting_fsync(fd):
+        calls.append(fd)
+        fsync(fd)
+
+    monkeypatch.setattr(pypwsafe.os, "fsync", counting_fsync)
+    return calls
+
+
+def test_saved_safe_should_reopen(tmp_path, new_safe, reopen):
+    safe = with_record(new_safe())
+    safe.save()
+    reopened = reopen(safe, "RO")
+    assert reopened.hmac_verified
+    assert [r.getTitle() for r in reopened.records] == [b"saved"]
+    assert os.listdir(tmp_path) == ["new.psafe3"]
+
+
+def test_loaded_safe_should_save(test_safe, reopen):
+    safe = test_safe("EmptyGroupTest.psafe3", "RW")
+    safe.records[0].setTitle("changed")
+    safe.save()
+    reopened = reopen(safe, "RO")
+    assert reopened.records[0].getTitle() == b"changed"
+
+
+@pytest.mark.parametrize(
+    "durability,fsyncs",
+    [(consts.DURABILITY_NONE, 0), (consts.DURABILITY_FILE, 1), (consts.DURABILITY_DIR, 2)],
+)
+def test_durability_should_choose_fsyncs(monkeypatch, durability, fsyncs, new_safe):
+    calls = count_fsyncs(monkeypatch)
+    safe = with_record(new_safe())
+    safe.save(durability)
+    assert len(calls) == fsyncs
+    assert set(safe.save_timings) == {
+        "serialize", "write", "fsync", "replace", "fsync_dir", "total"
+    }
+
+
+def test_default_durability_should_be_used(monkeypatch, new_safe):
+    calls = count_fsyncs(monkeypatch)
+    safe = with_record(new_safe())
+    safe.durability = consts.DURABILITY_NONE
+    safe.save()
+    assert calls == []
+
+
+def test_unknown_durability_should_fail(new_safe):
+    safe = with_record(new_safe())
+    with pytest.raises(ValueError):
+        safe.save("sometimes")
+    assert not os.path.exists(safe.filename)
+
+
+def test_failed_save_should_keep_old_file(tmp_path, monkeypatch, new_safe):
+    safe = with_record(new_safe())
+    safe.save()
+    with open(safe.filename, "rb") as fl:
+        before = fl.read()
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pypwsafe.os, "replace", failing_replace)
+    safe.records[0].setTitle("lost")
+    with pytest.raises(OSError):
+        safe.save()
+    with open(safe.filename, "rb") as fl:
+        assert fl.read() == before
+    assert os.listdir(tmp_path) == ["new.psafe3"]
+
+
+def test_save_should_keep_file_mode(new_safe):
+    safe = with_record(new_safe())
+    safe.save()
+    os.chmod(safe.filename, 0o640)
+    safe.save()
+    assert stat.S_IMODE(os.stat(safe.filename).st_mode) == 0o640
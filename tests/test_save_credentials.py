@@ -0,0 +1,75 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import pypwsafe
+from pypwsafe import PWSafe3
+
+
+SAFE_FILENAME = "VersionTest.psafe3"
+
+
+@pytest.fixture()
+def stretch_calls(monkeypatch):
+    calls = []
+    real_stretchkey = pypwsafe.stretchkey
+
+    def counting_stretchkey(*args, **kwargs):
+        calls.append(args)
+        return real_stretchkey(*args, **kwargs)
+
+    monkeypatch.setattr(pypwsafe, "stretchkey", counting_stretchkey)
+    return calls
+
+
+def write_out(safe):
+    safe.serialiaze()
+    with open(safe.filename, "wb") as f:
+        f.write(safe.flfull)
+
+
+def test_save_should_not_stretch_when_credentials_unchanged(test_safe, stretch_calls, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    del stretch_calls[:]
+    b1b2 = safe.b1b2
+    write_out(safe)
+    assert stretch_calls == []
+    assert safe.b1b2 == b1b2
+    reopened = reopen(safe, "RO")
+    assert len(reopened) == len(safe)
+
+
+def test_save_should_stretch_once_after_password_change(test_safe, stretch_calls):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    del stretch_calls[:]
+    safe.password = b"new password"
+    write_out(safe)
+    write_out(safe)
+    assert len(stretch_calls) == 1
+    reopened = PWSafe3(safe.filename, "new password", mode="RO")
+    assert len(reopened) == len(safe)
+
+
+def test_save_should_stretch_after_iteration_change(test_safe, stretch_calls, reopen):
+    safe = test_safe(SAFE_FILENAME, "RW")
+    del stretch_calls[:]
+    safe.iter = 4096
+    write_out(safe)
+    assert len(stretch_calls) == 1
+    reopened = reopen(safe, "RO")
+    assert reopened.iter == 4096
@@ -0,0 +1,68 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+from pytest import raises
+
+import pickle
+
+from pypwsafe import consts
+from pypwsafe.headers import Header, headers
+from pypwsafe.records import RecordProp, RecordPropTypes, TitleRecordProp
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def test_props_and_headers_should_have_no_dict():
+    for cls in [*RecordPropTypes.values(), *headers.values()]:
+        assert not hasattr(cls(), "__dict__"), cls
+    for cls in [RecordProp, Header]:
+        assert all("__slots__" in vars(c) for c in cls.__mro__[:-1])
+
+
+def test_parsed_fields_should_drop_raw_data(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    assert all(h.raw_data is None for h in safe.headers)
+    for record in safe.records:
+        assert all(p.raw_data is None for p in record.records)
+
+
+def test_raw_data_should_be_kept_when_asked(test_safe, monkeypatch):
+    monkeypatch.setattr(consts, "KEEP_RAW_DATA", True)
+    safe = test_safe(SAFE_FILENAME, "RO")
+    for record in safe.records:
+        for prop in record.records:
+            assert prop.raw_data[5:prop.len + 5] == prop.data
+            assert len(prop.raw_data) % 16 == 0
+
+
+def test_unknown_prop_should_keep_its_type():
+    prop = RecordProp(0x70, 3, b"\x03\x00\x00\x00\x70abc" + bytes(8))
+    assert prop.rTYPE is None
+    assert prop.serialiaze()[:8] == b"\x03\x00\x00\x00\x70abc"
+
+
+def test_unlisted_attribute_should_fail():
+    with raises(AttributeError):
+        TitleRecordProp().extra = 1
+
+
+def test_records_should_pickle(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    records = pickle.loads(pickle.dumps(safe.records))
+    assert [r.getTitle() for r in records] == [r.getTitle() for r in safe.records]
+    assert [r.hmac_data() for r in records] == [r.hmac_data() for r in safe.records]
@@ -0,0 +1,63 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+from pypwsafe import PWSafe3, blocks, errors
+
+
+def contents(safe):
+    return (
+        [hdr.data for hdr in safe.headers],
+        [rec.hmac_data() for rec in safe.records],
+    )
+
+
+@pytest.mark.parametrize(
+    "name", ["EmptyGroupTest.psafe3", "PasswordPolicyTest.psafe3"]
+)
+def test_streamed_safe_should_match_regular_load(test_safe, name, reopen):
+    safe = test_safe(name, "RO")
+    streamed = reopen(safe, "RO", stream=True)
+    assert contents(streamed) == contents(safe)
+    assert streamed.flfull is None
+    assert streamed.fulldata is None
+
+
+def test_stream_should_work_with_chunks_smaller_than_fields(test_safe, monkeypatch, reopen):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    monkeypatch.setattr(PWSafe3, "stream_chunk_size", 16)
+    streamed = reopen(safe, "RO", stream=True)
+    assert contents(streamed) == contents(safe)
+
+
+def test_stream_should_reject_bad_password(test_safe):
+    safe = test_safe("EmptyGroupTest.psafe3", "RO")
+    with pytest.raises(errors.PasswordError):
+        PWSafe3(safe.filename, "wrong", mode="RO", stream=True)
+
+
+def test_chunked_reader_should_join_blocks_across_chunks():
+    data = bytes(range(96))
+    reader = blocks.ChunkedBlockReader([data[:16], data[16:80], data[80:]])
+    assert reader(2) == data[:32]
+    assert reader(3) == data[32:80]
+    assert reader.has_more()
+    assert reader() == data[80:]
+    assert not reader.has_more()
+    with pytest.raises(EOFError):
+        reader()
@@ -0,0 +1,53 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+from pypwsafe import stretch, stretchkey
+
+
+SALT = bytes(range(32))
+
+
+@pytest.mark.parametrize("name", stretch.available_engines())
+@pytest.mark.parametrize("count", [1, 2, 3, 2048])
+def test_engine_should_match_reference_loop(name, count):
+    reference = stretch.get_engine("python").stretch(b"bogus12345", SALT, count)
+    assert stretch.get_engine(name).stretch(b"bogus12345", SALT, count) == reference
+
+
+def test_stretchkey_should_use_given_engine():
+    assert stretchkey(b"pw", SALT, 5, engine="python") == stretchkey(b"pw", SALT, 5)
+
+
+def test_auto_selected_engine_should_be_the_fastest_available():
+    stretch.set_engine(None)
+    assert stretch.get_engine().NAME == stretch.available_engines()[0]
+
+
+def test_unknown_engine_should_raise_error():
+    with pytest.raises(ValueError):
+        stretch.get_engine("bogus")
+
+
+def test_opening_safe_should_work_with_reference_engine(test_safe):
+    stretch.set_engine("python")
+    try:
+        safe = test_safe("VersionTest.psafe3", "RO")
+        assert len(safe) == 9
+    finally:
+        stretch.set_engine(None)
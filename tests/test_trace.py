@@ -0,0 +1,81 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import logging
+
+from pypwsafe import trace
+from pypwsafe.records import EOERecordProp
+
+
+SAFE_FILENAME = "EmptyGroupTest.psafe3"
+
+
+def test_loading_should_not_log_per_field(test_safe, caplog):
+    caplog.set_level(logging.DEBUG)
+    safe = test_safe(SAFE_FILENAME, "RO")
+    fields = sum(len(r) for r in safe.records)
+    records = [r for r in caplog.records if r.name == "psafe.lib.record"]
+    assert len(records) < fields
+
+
+def test_collect_should_give_field_offsets(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    with trace.collect() as events:
+        reopen(safe, "RO")
+    assert not trace.active
+    headers = [e for e in events if e.event == "header"]
+    fields = [e for e in events if e.event == "field"]
+    assert len(headers) == len(safe.headers)
+    assert len(fields) == sum(len(r) for r in safe.records)
+    assert headers[0].offset == 0
+    offsets = [e.offset for e in headers + fields]
+    assert offsets == sorted(offsets)
+    assert sum(isinstance(e.value, EOERecordProp) for e in fields) == len(safe)
+
+
+def test_lazy_fields_should_be_traced(test_safe, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    with trace.collect() as events:
+        reopen(safe, "RO", lazy=True)
+    fields = [e for e in events if e.event == "field"]
+    assert len(fields) == sum(len(r) for r in safe.records)
+    assert all(e.value is None for e in fields)
+
+
+def test_serialize_should_be_traced(test_safe):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    with trace.collect() as events:
+        safe.serialiaze()
+    assert len([e for e in events if e.event == "serialize"]) == len(safe.headers) + sum(
+        len(r) for r in safe.records
+    )
+
+
+def test_field_logging_should_log_fields(test_safe, caplog, reopen):
+    safe = test_safe(SAFE_FILENAME, "RO")
+    caplog.set_level(logging.DEBUG, logger="psafe.lib.trace")
+    trace.set_field_logging()
+    try:
+        reopen(safe, "RO")
+    finally:
+        trace.set_field_logging(False)
+    assert not trace.active
+    records = [
+        r for r in caplog.records
+        if r.name == "psafe.lib.trace" and r.args[0] in ("header", "field")
+    ]
+    assert len(records) == len(safe.headers) + sum(len(r) for r in safe.records)
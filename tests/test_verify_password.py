@@ -0,0 +1,55 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+from pypwsafe import PPrimeCache, PWSafe3, errors
+
+
+SAFE_FILENAME = "VersionTest.psafe3"
+
+
+def test_correct_password_should_verify(test_password, test_safe_path):
+    assert PWSafe3.verify_password(test_safe_path(SAFE_FILENAME), test_password)
+
+
+def test_wrong_password_should_not_verify(test_safe_path):
+    assert not PWSafe3.verify_password(test_safe_path(SAFE_FILENAME), "wrong")
+
+
+def test_verified_password_should_be_cached(test_password, test_safe_path):
+    cache = PPrimeCache()
+    path = test_safe_path(SAFE_FILENAME)
+    assert PWSafe3.verify_password(path, test_password, pprime_cache=cache)
+    assert not PWSafe3.verify_password(path, "wrong", pprime_cache=cache)
+    assert len(cache) == 1
+
+
+def test_non_safe_file_should_raise_error(tmp_path, test_password):
+    path = tmp_path / "bogus.psafe3"
+    path.write_bytes(b"not a safe")
+    with pytest.raises(errors.NotASafeError):
+        PWSafe3.verify_password(path, test_password)
+
+
+def test_too_few_iterations_should_raise_error(tmp_path, test_password, test_safe_path):
+    path = tmp_path / "crafted.psafe3"
+    data = bytearray(test_safe_path(SAFE_FILENAME).read_bytes())
+    data[36:40] = bytes(4)
+    path.write_bytes(data)
+    with pytest.raises(errors.NotASafeError):
+        PWSafe3.verify_password(path, test_password)
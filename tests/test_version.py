@@ -20,6 +20,8 @@
 import pytest
 
 
+TEST_PASSWORD = "bogus12345"
+
 SAFE_FILENAME = "VersionTest.psafe3"
 
 
@@ -38,3 +40,15 @@ def test_set_pretty_version_should_raise_error_with_bogus_version(test_safe):
     safe = test_safe(SAFE_FILENAME, "RO")
     with pytest.raises(ValueError):
         safe.setVersionPretty(version="Bogus version")
+
+
+def test_new_version_header_should_save(new_safe, reopen):
+    safe = new_safe()
+    safe.setVersion(0x030D)
+    safe.setVersionPretty(version="PasswordSafe V3.28")
+    repr(safe.headers[0])
+    safe.save()
+    reopened = reopen(safe, "RO")
+    assert reopened.hmac_verified
+    assert reopened.headers[0].type == 0x00
+    assert reopened.headers[0].data == b"\x0a\x03"
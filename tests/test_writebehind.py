@@ -0,0 +1,193 @@
+# =============================================================================
+# This file is part of PyPWSafe.
+#
+# PyPWSafe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# PyPWSafe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyPWSafe.  If not, see <http://www.gnu.org/licenses/>.
+# =============================================================================
+
+import pytest
+
+import os
+import threading
+import time
+
+from pypwsafe import PWSafe3, errors
+from pypwsafe.records import Record
+from pypwsafe.writebehind import WriteBehind
+
+
+def add_record(safe, title):
+    record = Record()
+    record.setTitle(title)
+    safe.records.append(record)
+    safe.save()
+
+
+def count_writes(monkeypatch):
+    writes = []
+    write = PWSafe3._write
+
+    def counting_write(self, data, durability, serialize_time):
+        locked = os.path.exists(self.locked or "")
+        write(self, data, durability, serialize_time)
+        writes.append(locked)
+
+    monkeypatch.setattr(PWSafe3, "_write", counting_write)
+    return writes
+
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(0.01)
+
+
+def titles(safe):
+    return [r.getTitle() for r in safe.records]
+
+
+def test_saves_should_be_coalesced(tmp_path, monkeypatch, new_safe, reopen):
+    writes = count_writes(monkeypatch)
+    safe = new_safe()
+    with WriteBehind(safe, interval=60) as saver:
+        for i in range(20):
+            add_record(safe, "entry %d" % i)
+        assert saver.pending == 20
+        assert writes == []
+    assert writes == [True]
+    assert safe.write_behind is None
+    assert len(titles(reopen(safe))) == 20
+    assert not os.path.exists(os.path.join(tmp_path, "new.plk"))
+
+
+def test_interval_should_save_in_background(monkeypatch, new_safe, reopen):
+    writes = count_writes(monkeypatch)
+    safe = new_safe()
+    with WriteBehind(safe, interval=0.05) as saver:
+        with saver.changes():
+            add_record(safe, "first")
+        wait_for(lambda: writes)
+        assert saver.pending == 0
+        assert titles(reopen(safe)) == [b"first"]
+    assert len(writes) == 1
+
+
+def test_max_changes_should_save_in_background(monkeypatch, new_safe):
+    writes = count_writes(monkeypatch)
+    safe = new_safe()
+    with WriteBehind(safe, interval=None, max_changes=3) as saver:
+        add_record(safe, "one")
+        saver.mark_dirty(2)
+        wait_for(lambda: writes)
+    assert len(writes) == 1
+
+
+def test_flush_should_save_now(new_safe, reopen):
+    safe = new_safe()
+    with WriteBehind(safe, interval=60) as saver:
+        assert not saver.flush()
+        add_record(safe, "flushed")
+        assert saver.flush()
+        assert titles(reopen(safe)) == [b"flushed"]
+        assert not saver.flush()
+
+
+def test_failed_save_should_keep_changes(tmp_path, new_safe, reopen):
+    safe = new_safe()
+    saver = WriteBehind(safe, interval=60)
+    add_record(safe, "kept")
+    # Another holder of the lock file makes the save fail
+    lfile = os.path.join(tmp_path, "new.plk")
+    with open(lfile, "w") as fl:
+        fl.write("someone@otherhost:1")
+    with pytest.raises(errors.AlreadyLockedError):
+        saver.flush()
+    assert saver.pending == 1
+    os.remove(lfile)
+    saver.close()
+    assert saver.pending == 0
+    assert titles(reopen(safe)) == [b"kept"]
+
+
+def test_held_lock_should_be_used(monkeypatch, new_safe):
+    writes = count_writes(monkeypatch)
+    safe = new_safe()
+    safe.lock()
+    with WriteBehind(safe, interval=60):
+        add_record(safe, "locked")
+    assert writes == [True]
+    assert safe.locked
+    safe.unlock()
+
+
+def test_save_after_close_should_write(monkeypatch, new_safe):
+    writes = count_writes(monkeypatch)
+    safe = new_safe()
+    WriteBehind(safe, interval=60).close()
+    add_record(safe, "direct")
+    assert len(writes) == 1
+
+
+def test_bad_arguments_should_fail(test_safe, new_safe):
+    with pytest.raises(errors.ROSafe):
+        WriteBehind(test_safe("EmptyGroupTest.psafe3", "RO"))
+    safe = new_safe()
+    with pytest.raises(ValueError):
+        WriteBehind(safe, interval=None)
+    with pytest.raises(ValueError):
+        WriteBehind(safe, max_changes=0)
+    with WriteBehind(safe):
+        with pytest.raises(ValueError):
+            WriteBehind(safe)
+
+
+def test_lock_should_wait_for_write(monkeypatch, new_safe, reopen):
+    writing = threading.Event()
+    release = threading.Event()
+    write = PWSafe3._write
+
+    def slow_write(self, data, durability, serialize_time):
+        writing.set()
+        release.wait(5)
+        write(self, data, durability, serialize_time)
+
+    monkeypatch.setattr(PWSafe3, "_write", slow_write)
+    safe = new_safe()
+    with WriteBehind(safe, interval=0) as saver:
+        add_record(safe, "first")
+        assert writing.wait(5)
+        locker = threading.Thread(target=safe.lock)
+        locker.start()
+        locker.join(0.1)
+        assert locker.is_alive()
+        release.set()
+        locker.join(5)
+        assert safe.locked
+        assert not saver._lock_owned
+        add_record(safe, "second")
+        saver.flush()
+        assert safe.locked
+        safe.unlock()
+    assert titles(reopen(safe)) == [b"first", b"second"]
+
+
+def test_close_inside_changes_should_fail(new_safe, reopen):
+    safe = new_safe()
+    saver = WriteBehind(safe, interval=60)
+    with saver.changes():
+        add_record(safe, "inside")
+        with pytest.raises(RuntimeError):
+            saver.close()
+    saver.close()
+    assert titles(reopen(safe)) == [b"inside"]